@@ -0,0 +1,27 @@
+import hmac
+
+from config import ADMIN_TOKEN
+
+ADMIN_PREFIX = "/admin/"
+# Paths open to cross-origin browser calls: everything but the admin endpoints.
+PUBLIC_PATHS = r"^/(?!admin/).*"
+
+
+def admin_error(authorization, token=ADMIN_TOKEN):
+    """
+    Checks the Authorization header of an /admin/* request against the admin
+    token. Returns None when it matches, otherwise the error body, status and
+    headers to answer with.
+    """
+    if not token:
+        return {"error": "Admin endpoints are disabled!"}, 403, {}
+    scheme, _, credentials = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        credentials.strip().encode(), token.encode()
+    ):
+        return (
+            {"error": "A valid admin token is required!"},
+            401,
+            {"WWW-Authenticate": "Bearer"},
+        )
+    return None
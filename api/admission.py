@@ -0,0 +1,73 @@
+import threading
+import time
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed instead of being served."""
+
+
+class AdmissionController:
+    """
+    Bounds the work a process takes on. At most max_concurrent requests run
+    at once and at most max_queue wait for a slot; a request arriving to a
+    full queue is shed immediately, and a queued request that cannot start
+    before its deadline is shed when the deadline passes. Either way the
+    caller gets Overloaded quickly rather than a slow timeout.
+    """
+
+    def __init__(self, max_concurrent, max_queue, deadline_ms):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.deadline = deadline_ms / 1000
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_deadline = 0
+        self._condition = threading.Condition()
+
+    def new_deadline(self):
+        return time.monotonic() + self.deadline
+
+    def run(self, fn, *args, deadline=None):
+        """
+        Runs fn(*args) once a slot is free. deadline defaults to the configured
+        deadline from now; the ASGI app sets it when the request arrives.
+        """
+        with self._condition:
+            if self.running + self.waiting >= self.max_concurrent + self.max_queue:
+                self.shed_queue_full += 1
+                raise Overloaded("The queue is full.")
+            deadline = deadline or self.new_deadline()
+            self.waiting += 1
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed_deadline += 1
+                        raise Overloaded("The request could not start in time.")
+                    if self.running < self.max_concurrent:
+                        break
+                    self._condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.running += 1
+            self.admitted += 1
+
+        try:
+            return fn(*args)
+        finally:
+            with self._condition:
+                self.running -= 1
+                self._condition.notify()
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "queued": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_deadline": self.shed_deadline,
+        }
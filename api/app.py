@@ -2,73 +2,335 @@
 from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
 
-import torch
-from sentence_transformers import SentenceTransformer
-
-import pandas as pd
 import os
-import numpy as np
+import time
 
-from hnsw_manager import HNSWIndexManager
-from utils import set_seed, process_text
+import metrics
+from admin_auth import ADMIN_PREFIX, PUBLIC_PATHS, admin_error
+from admission import AdmissionController, Overloaded
+from bundle import BundleManager, ServingBundle, resolve_bundle_dir
+from config import (
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_MAX_QUEUE,
+    BUNDLE_PATH,
+    COMPRESSION_MIN_BYTES,
+    CORS_ORIGINS,
+    LOAD_IN_BACKGROUND,
+    MAX_BATCH_QUERIES,
+    PLOTS_DIR,
+    REQUEST_DEADLINE_MS,
+    SERVER_TIMING,
+)
+from pagination import Cursor
+from request_options import check_labels, page_options, query_options
+from serialization import OrjsonProvider, compress
+from utils import memory_usage, set_seed
 
 app = Flask(__name__)
-CORS(app)
+app.json = OrjsonProvider(app)
+CORS(
+    app,
+    resources={PUBLIC_PATHS: {"origins": CORS_ORIGINS}},
+    expose_headers=["X-Bundle-Version", "X-Next-Cursor"],
+)
 
 set_seed()
 
-base_dir = os.path.dirname(os.path.abspath(__file__))
-data_path = os.path.join(base_dir, "data", "data.xlsx")
-plots_dir = os.path.join(base_dir, "plots")
-embeddings_path = os.path.join(base_dir, "embeddings", "embeddings.npy")
+if BUNDLE_PATH:
+    initial_bundle = ServingBundle.from_path(BUNDLE_PATH)
+else:
+    initial_bundle = ServingBundle.from_config()
+bundles = BundleManager.start(initial_bundle, background=LOAD_IN_BACKGROUND)
+
+admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, REQUEST_DEADLINE_MS
+)
+metrics.registry.collector(lambda: metrics.service_metrics(bundles, admission))
+
+
+def with_bundle_version(response, bundle):
+    response.headers["X-Bundle-Version"] = bundle.version
+    return response
+
+
+@app.before_request
+def start_timer():
+    request.started_at = time.perf_counter()
+    request.stage_timings = metrics.start_request()
+
+
+@app.before_request
+def require_admin_token():
+    if request.path.startswith(ADMIN_PREFIX):
+        error = admin_error(request.headers.get("Authorization"))
+        if error:
+            body, status, headers = error
+            return jsonify(body), status, headers
+
+
+# Endpoints served while the first bundle is still loading.
+STARTUP_ENDPOINTS = {"ready", "prometheus_metrics"}
+
+
+@app.before_request
+def require_ready():
+    if not bundles.ready and request.endpoint not in STARTUP_ENDPOINTS:
+        return (
+            jsonify({"error": "The service is starting, try again later!"}),
+            503,
+            {"Retry-After": "1"},
+        )
+
 
-data = pd.read_excel(data_path)
-embeddings = np.load(embeddings_path)
+@app.before_request
+def follow_reloads():
+    # Starts the reloads requested from the other worker processes.
+    if bundles.ready:
+        bundles.follow_reloads()
 
-model = SentenceTransformer("multi-qa-mpnet-base-dot-v1")
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model = model.to(device)
 
-hnsw_manager = HNSWIndexManager(embeddings)
+@app.before_request
+def sync_articles():
+    # Applies articles added or deleted by the other worker processes.
+    if bundles.ready:
+        bundles.active.sync()
+
+
+# Registered before compress_response, so it runs after it and the compression
+# time is part of the request.
+@app.after_request
+def record_request(response):
+    elapsed = time.perf_counter() - request.started_at
+    metrics.observe_request(
+        request.endpoint or "unmatched", response.status_code, elapsed
+    )
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = metrics.server_timing(
+            request.stage_timings, elapsed
+        )
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    if response.mimetype != "application/json" or response.direct_passthrough:
+        return response
+    response.vary.add("Accept-Encoding")
+    body, encoding = compress(
+        response.get_data(),
+        request.headers.get("Accept-Encoding"),
+        COMPRESSION_MIN_BYTES,
+    )
+    if encoding:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    return (
+        jsonify({"error": "The service is overloaded, try again later!"}),
+        503,
+        {"Retry-After": "1"},
+    )
+
+
+def with_next_cursor(response, cursor):
+    if cursor is not None:
+        response.headers["X-Next-Cursor"] = cursor.encode()
+    return response
 
 
 @app.route("/similar-articles", methods=["POST"])
 def recommend():
+    # maxResults is the page size; further pages are requested with the
+    # cursor from the X-Next-Cursor header instead of a query.
     content = request.get_json(silent=True)
-    if not content or "query" not in content:
+    cursor = request.args.get("cursor")
+    if cursor is None and (not content or "query" not in content):
         return jsonify({"error": "Query input is required!"}), 400
 
-    q_input = content["query"]
-    max_results = request.args.get("maxResults", default=3, type=int)
-    if max_results > 4:
-        return jsonify({"error": "Max results should not exceed 4!"}), 400
-
-    processed_query = process_text(q_input)
-    query_embedding = model.encode([processed_query])[0]
-    ids, distances = hnsw_manager.query(query_embedding, k=max_results)
-
-    best_fits = []
-    for i, dist in zip(ids[0], distances[0]):
-        best_fits.append(
-            {
-                "id": int(i),
-                "title": data["Title"].values[i],
-                "label": data["Label"].values[i],
-                "text": data["Text"].values[i],
-                "url": data["URL"].values[i],
-                "distance": float(dist),
-            }
+    bundle = bundles.active
+    try:
+        max_results, view = page_options(request.args)
+        if cursor is not None:
+            cursor = Cursor.decode(cursor)
+            check_labels(cursor.labels, bundle)
+        else:
+            ef, labels = query_options(request.args, content, bundle)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if cursor is not None:
+        best_fits, next_cursor = bundle.similar_articles_page(
+            cursor, max_results, admission.run
+        )
+    else:
+        best_fits, next_cursor = bundle.find_similar_articles_page(
+            content["query"], max_results, labels, ef, admission.run
+        )
+    response = with_bundle_version(jsonify(view.apply(best_fits)), bundle)
+    return with_next_cursor(response, next_cursor)
+
+
+@app.route("/similar-articles/batch", methods=["POST"])
+def recommend_batch():
+    content = request.get_json(silent=True)
+    queries = content.get("queries") if isinstance(content, dict) else None
+    if not (
+        queries
+        and isinstance(queries, list)
+        and all(isinstance(query, str) for query in queries)
+    ):
+        return jsonify({"error": "A list of queries is required!"}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return (
+            jsonify({"error": f"Batch should not exceed {MAX_BATCH_QUERIES} queries!"}),
+            400,
         )
 
-    return jsonify(best_fits)
+    bundle = bundles.active
+    try:
+        max_results, view = page_options(request.args)
+        ef, labels = query_options(request.args, content, bundle)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    best_fits = bundle.find_similar_articles_batch(
+        queries, max_results, labels, ef, admission.run
+    )
+    best_fits = [view.apply(row) for row in best_fits]
+    return with_bundle_version(jsonify(best_fits), bundle)
+
+
+@app.route("/articles/<int:article_id>/similar", methods=["GET"])
+def similar_to_article(article_id):
+    try:
+        max_results, view = page_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    bundle = bundles.active
+    if not bundle.article_store.is_live(article_id):
+        return jsonify({"error": "Article not found!"}), 404
+    best_fits = bundle.find_articles_like(article_id, max_results)
+    return with_bundle_version(jsonify(view.apply(best_fits)), bundle)
+
+
+@app.route("/admin/cache", methods=["GET"])
+def cache_stats():
+    bundle = bundles.active
+    return jsonify(
+        {
+            "embeddings": bundle.embedding_cache.stats(),
+            "results": bundle.result_cache.stats(),
+            "cursors": bundle.cursors.stats(),
+        }
+    )
+
+
+@app.route("/admin/cache", methods=["DELETE"])
+def clear_cache():
+    bundles.active.invalidate_caches()
+    return "", 204
+
+
+@app.route("/admin/load", methods=["GET"])
+def load_stats():
+    return jsonify(
+        {
+            "admission": admission.stats(),
+            "coalescing": bundles.active.in_flight.stats(),
+        }
+    )
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    if not bundles.ready:
+        return jsonify({"ready": False, "load": bundles.reload_status}), 503
+    return jsonify(
+        {
+            "ready": True,
+            "bundle": bundles.active.version,
+            "startup": bundles.startup,
+        }
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return metrics.registry.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+
+@app.route("/admin/bundle", methods=["GET"])
+def bundle_status():
+    return jsonify(
+        {"active": bundles.active.describe(), "reload": bundles.reload_status}
+    )
+
+
+@app.route("/admin/reload", methods=["POST"])
+def reload_bundle():
+    content = request.get_json(silent=True) or {}
+    bundle_dir = content.get("bundle")
+    if bundle_dir:
+        try:
+            bundle_dir = resolve_bundle_dir(bundle_dir)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 403
+        if not os.path.exists(os.path.join(bundle_dir, "bundle.json")):
+            return jsonify({"error": "Bundle not found!"}), 404
+    if not bundles.request_reload(bundle_dir):
+        return jsonify({"error": "A reload is already in progress!"}), 409
+    return jsonify(bundles.reload_status), 202
+
+
+@app.route("/admin/articles", methods=["POST"])
+def ingest_articles():
+    content = request.get_json(silent=True)
+    articles = content.get("articles") if isinstance(content, dict) else None
+    if not articles or not all(
+        isinstance(article, dict) and "text" in article for article in articles
+    ):
+        return jsonify({"error": "A list of articles with a text is required!"}), 400
+
+    records = [
+        {
+            "Title": str(article.get("title", "")),
+            "Label": str(article.get("label", "")),
+            "Text": str(article["text"]),
+            "URL": str(article.get("url", "")),
+        }
+        for article in articles
+    ]
+    bundle = bundles.active
+    ids = bundle.add_articles(records)
+    return with_bundle_version(jsonify({"ids": ids}), bundle), 201
+
+
+@app.route("/admin/articles/<int:article_id>", methods=["DELETE"])
+def remove_article(article_id):
+    try:
+        bundles.active.delete_articles([article_id])
+    except KeyError:
+        return jsonify({"error": "Article not found!"}), 404
+    return "", 204
+
+
+@app.route("/admin/memory", methods=["GET"])
+def worker_memory():
+    return jsonify(memory_usage())
+
 
 @app.route('/base-model-plot')
 def base_model_plot():
-    return send_from_directory(plots_dir, 'base_model_plot.html')
+    return send_from_directory(PLOTS_DIR, 'base_model_plot.html')
 
 @app.route('/trained-model-plot')
 def trained_model_plot():
-    return send_from_directory(plots_dir, 'trained_model_plot.html')
+    return send_from_directory(PLOTS_DIR, 'trained_model_plot.html')
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,244 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+
+import numpy as np
+
+from hnsw_manager import file_fingerprint
+
+COLUMNS = ["Title", "Label", "Text", "URL"]
+
+
+class ArticleStore:
+    """
+    Read-only columnar article store. Each column is one UTF-8 blob plus an
+    array of row offsets, both memory-mapped, so a record is fetched in O(1)
+    and the pages are shared between every process that opens the store.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self._open()
+
+    def _open(self):
+        with open(os.path.join(self.store_dir, "meta.json")) as f:
+            meta = json.load(f)
+        offsets = {}
+        blobs = {}
+        for column in meta["columns"]:
+            offsets[column] = np.load(
+                os.path.join(self.store_dir, f"{column}.offsets.npy"), mmap_mode="r"
+            )
+            blobs[column] = self._map_blob(
+                os.path.join(self.store_dir, f"{column}.bin")
+            )
+
+        deleted_path = os.path.join(self.store_dir, "deleted.npy")
+        if os.path.exists(deleted_path):
+            deleted = np.load(deleted_path)
+        else:
+            deleted = np.zeros(meta["count"], dtype=bool)
+
+        # Writers replace meta.json last, so the files read after it cover at
+        # least its count. meta is assigned last too, so a concurrent reader
+        # bounded by len(self) never indexes past the arrays.
+        self._offsets = offsets
+        self._blobs = blobs
+        self.deleted = deleted
+        self.columns = meta["columns"]
+        self.meta = meta
+
+    def refresh(self):
+        """
+        Re-reads the store from disk, picking up rows appended and deletions
+        made by other processes since it was opened.
+        """
+        self._open()
+
+    def version(self):
+        # Changes whenever another process appends or deletes, so a stat per
+        # request tells whether refresh is needed.
+        version = []
+        for name in ("meta.json", "deleted.npy"):
+            path = os.path.join(self.store_dir, name)
+            version.append(os.stat(path).st_mtime_ns if os.path.exists(path) else None)
+        return tuple(version)
+
+    @staticmethod
+    def _map_blob(path):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def value(self, column, i):
+        offsets = self._offsets[column]
+        start, end = offsets[i], offsets[i + 1]
+        return self._blobs[column][start:end].decode("utf-8")
+
+    def get(self, i):
+        return {column: self.value(column, i) for column in self.columns}
+
+    def get_many(self, ids):
+        return [self.get(int(i)) for i in ids]
+
+    def column(self, column):
+        return [self.value(column, i) for i in range(len(self))]
+
+    def fingerprint(self, column="Text", chunk_size=1 << 20):
+        """
+        SHA-256 of a column's values in row order, deleted rows included. The
+        offsets are hashed too, so moving a row boundary changes it, and bytes
+        past the last row, left by an interrupted append, are not.
+        """
+        offsets = self._offsets[column][: len(self) + 1]
+        blob = self._blobs[column]
+        sha = hashlib.sha256(np.ascontiguousarray(offsets).tobytes())
+        end = int(offsets[-1])
+        for start in range(0, end, chunk_size):
+            sha.update(blob[start : min(start + chunk_size, end)])
+        return sha.hexdigest()
+
+    def is_live(self, i):
+        return 0 <= i < len(self) and not self.deleted[i]
+
+    def deleted_ids(self):
+        return np.flatnonzero(self.deleted)
+
+    def append(self, records):
+        """
+        Appends records and returns their ids. Blobs only grow and offsets and
+        meta.json are replaced atomically, so readers never see a partial row.
+        """
+        start = len(self)
+        for column in self.columns:
+            offsets = self._offsets[column]
+            new_offsets = np.empty(len(records), dtype=np.int64)
+            position = int(offsets[start])
+            with open(os.path.join(self.store_dir, f"{column}.bin"), "ab") as f:
+                # Drop bytes left behind by an append that was interrupted.
+                f.truncate(position)
+                for row, record in enumerate(records):
+                    encoded = record[column].encode("utf-8")
+                    f.write(encoded)
+                    position += len(encoded)
+                    new_offsets[row] = position
+            self._save_array(
+                os.path.join(self.store_dir, f"{column}.offsets.npy"),
+                np.concatenate([offsets[: start + 1], new_offsets]),
+            )
+
+        deleted = np.concatenate([self.deleted, np.zeros(len(records), dtype=bool)])
+        self._save_array(os.path.join(self.store_dir, "deleted.npy"), deleted)
+        self._save_meta(self.store_dir, dict(self.meta, count=start + len(records)))
+        self._open()
+        return list(range(start, start + len(records)))
+
+    def delete(self, ids):
+        deleted = self.deleted.copy()
+        deleted[list(ids)] = True
+        self._save_array(os.path.join(self.store_dir, "deleted.npy"), deleted)
+        self.deleted = deleted
+
+    @classmethod
+    def write(cls, records, store_dir, columns=COLUMNS, source_fingerprint=None):
+        # Every file is written under a temporary name and moved into place, so
+        # processes that still map the old files keep reading consistent data.
+        # meta.json is replaced last, so a store is only valid once complete.
+        os.makedirs(store_dir, exist_ok=True)
+        for column in columns:
+            offsets = np.zeros(len(records) + 1, dtype=np.int64)
+            blob_path = os.path.join(store_dir, f"{column}.bin")
+            with open(blob_path + ".tmp", "wb") as f:
+                for row, record in enumerate(records):
+                    encoded = record[column].encode("utf-8")
+                    f.write(encoded)
+                    offsets[row + 1] = offsets[row] + len(encoded)
+            os.replace(blob_path + ".tmp", blob_path)
+            cls._save_array(os.path.join(store_dir, f"{column}.offsets.npy"), offsets)
+
+        cls._save_array(
+            os.path.join(store_dir, "deleted.npy"), np.zeros(len(records), dtype=bool)
+        )
+
+        meta = {
+            "columns": columns,
+            "count": len(records),
+            "source_sha256": source_fingerprint,
+        }
+        cls._save_meta(store_dir, meta)
+        return cls(store_dir)
+
+    @staticmethod
+    def _save_array(path, array):
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, array)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _save_meta(store_dir, meta):
+        meta_path = os.path.join(store_dir, "meta.json")
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    @classmethod
+    def from_excel(cls, excel_path, store_dir, columns=COLUMNS):
+        import pandas as pd
+
+        data = pd.read_excel(excel_path)
+        records = [
+            {
+                column: "" if pd.isna(value) else str(value)
+                for column, value in zip(columns, values)
+            }
+            for values in data[columns].itertuples(index=False)
+        ]
+        return cls.write(
+            records, store_dir, columns, source_fingerprint=file_fingerprint(excel_path)
+        )
+
+    @classmethod
+    def open_or_convert(cls, store_dir, excel_path):
+        """
+        Opens the store, converting it from the Excel file first when the store
+        is missing or was converted from a different version of that file.
+        """
+        meta_path = os.path.join(store_dir, "meta.json")
+        if os.path.exists(meta_path):
+            if not os.path.exists(excel_path):
+                return cls(store_dir)
+            with open(meta_path) as f:
+                source_fingerprint = json.load(f).get("source_sha256")
+            if source_fingerprint == file_fingerprint(excel_path):
+                return cls(store_dir)
+        return cls.from_excel(excel_path, store_dir)
+
+
+if __name__ == "__main__":
+    api_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(
+        description="Convert the article spreadsheet into a columnar article store."
+    )
+    parser.add_argument(
+        "--excel-path",
+        type=str,
+        default=os.path.join(api_dir, "data", "data.xlsx"),
+        help="Path to the source Excel file.",
+    )
+    parser.add_argument(
+        "--store-dir",
+        type=str,
+        default=os.path.join(api_dir, "data", "articles"),
+        help="Directory to write the article store to.",
+    )
+    args = parser.parse_args()
+
+    store = ArticleStore.from_excel(args.excel_path, args.store_dir)
+    print(f"Wrote {len(store)} articles to {args.store_dir}")
@@ -0,0 +1,458 @@
+# Asynchronous serving entry point with the same routes and responses as the
+# Flask app:
+#
+#     uvicorn asgi:app --host 127.0.0.1 --port 5000
+#
+# Request handling stays on the event loop, while text processing, encoding and
+# the kNN search run on a bounded thread pool, so slow clients never hold up
+# compute and a burst of requests cannot start unbounded work.
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.routing import Route
+
+import app as service
+import metrics
+from admin_auth import ADMIN_PREFIX, admin_error
+from admission import Overloaded
+from bundle import resolve_bundle_dir
+from config import (
+    ASGI_COMPUTE_WORKERS,
+    COMPRESSION_MIN_BYTES,
+    CORS_ORIGINS,
+    MAX_BATCH_QUERIES,
+    PLOTS_DIR,
+    SERVER_TIMING,
+)
+from pagination import Cursor
+from request_options import check_labels, page_options, query_options
+from serialization import compress, dumps
+from utils import memory_usage
+
+compute_pool = ThreadPoolExecutor(
+    max_workers=ASGI_COMPUTE_WORKERS, thread_name_prefix="compute"
+)
+
+
+class MetricsMiddleware:
+    # Counts and times requests like the Flask app's before/after_request
+    # hooks, labelled with the name of the endpoint function.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started_at = time.perf_counter()
+        timings = metrics.start_request()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    elapsed = time.perf_counter() - started_at
+                    header = metrics.server_timing(timings, elapsed)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", header.encode())
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            endpoint = scope.get("endpoint")
+            metrics.observe_request(
+                endpoint.__name__ if endpoint else "unmatched",
+                status,
+                time.perf_counter() - started_at,
+            )
+
+
+class PublicCORS:
+    # CORS for every path but the admin endpoints, like the Flask app's
+    # PUBLIC_PATHS resources.
+    def __init__(self, app):
+        self.app = app
+        self.cors = CORSMiddleware(
+            app,
+            allow_origins=CORS_ORIGINS,
+            allow_methods=["*"],
+            allow_headers=["*"],
+            expose_headers=["X-Bundle-Version", "X-Next-Cursor"],
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(ADMIN_PREFIX):
+            return await self.app(scope, receive, send)
+        await self.cors(scope, receive, send)
+
+
+class AdminAuth:
+    # Requires the admin token on /admin/*, like the Flask app's
+    # require_admin_token hook.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(ADMIN_PREFIX):
+            headers = dict(scope["headers"])
+            authorization = headers.get(b"authorization", b"").decode("latin-1")
+            error = admin_error(authorization)
+            if error:
+                body, status, error_headers = error
+                response = FlaskJSONResponse(body, status, headers=error_headers)
+                return await response(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+class StartupGate:
+    # Answers 503 until the first bundle is loaded, like the Flask app's
+    # require_ready hook.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] == "http"
+            and not service.bundles.ready
+            and scope["path"] not in ("/ready", "/metrics")
+        ):
+            response = FlaskJSONResponse(
+                {"error": "The service is starting, try again later!"},
+                503,
+                headers={"Retry-After": "1"},
+            )
+            return await response(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+class ReloadFollower:
+    # Starts the reloads requested from the other worker processes, like the
+    # Flask app's follow_reloads hook.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and service.bundles.ready:
+            service.bundles.follow_reloads()
+        await self.app(scope, receive, send)
+
+
+class ArticleSync:
+    # Applies articles added or deleted by other processes, like the Flask
+    # app's sync_articles hook. The check is a stat; catching up runs on the
+    # compute pool.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and service.bundles.ready:
+            bundle = service.bundles.active
+            if bundle.article_store.version() != bundle.store_version:
+                await run_compute(bundle.sync)
+        await self.app(scope, receive, send)
+
+
+class FlaskJSONResponse(JSONResponse):
+    # Serializes like Flask's jsonify, so both apps return identical bodies.
+    def render(self, content):
+        return dumps(content)
+
+
+def negotiated(request, response):
+    # Compresses the body like the Flask app's after_request hook.
+    response.headers.append("Vary", "Accept-Encoding")
+    body, encoding = compress(
+        response.body, request.headers.get("accept-encoding"), COMPRESSION_MIN_BYTES
+    )
+    if encoding:
+        response.body = body
+        response.headers["Content-Encoding"] = encoding
+        response.headers["Content-Length"] = str(len(body))
+    return response
+
+
+def paged(request, content, bundle, next_cursor):
+    headers = {"X-Bundle-Version": bundle.version}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor.encode()
+    return negotiated(request, FlaskJSONResponse(content, headers=headers))
+
+
+async def run_compute(fn, *args):
+    # The request's context is carried over, so stage timings recorded on the
+    # compute thread reach its Server-Timing header.
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        compute_pool, functools.partial(context.run, fn, *args)
+    )
+
+
+def admission_from_now():
+    # The deadline starts when the request arrives, so time spent waiting for
+    # a compute thread counts against it.
+    deadline = service.admission.new_deadline()
+    return functools.partial(service.admission.run, deadline=deadline)
+
+
+async def overloaded(request, exc):
+    return FlaskJSONResponse(
+        {"error": "The service is overloaded, try again later!"},
+        503,
+        headers={"Retry-After": "1"},
+    )
+
+
+async def recommend(request):
+    try:
+        content = await request.json()
+    except ValueError:
+        content = None
+    cursor = request.query_params.get("cursor")
+    if cursor is None and (not isinstance(content, dict) or "query" not in content):
+        return FlaskJSONResponse({"error": "Query input is required!"}, 400)
+
+    bundle = service.bundles.active
+    try:
+        max_results, view = page_options(request.query_params)
+        if cursor is not None:
+            cursor = Cursor.decode(cursor)
+            check_labels(cursor.labels, bundle)
+        else:
+            ef, labels = query_options(request.query_params, content, bundle)
+    except ValueError as e:
+        return FlaskJSONResponse({"error": str(e)}, 400)
+
+    if cursor is not None:
+        best_fits, next_cursor = await run_compute(
+            bundle.similar_articles_page, cursor, max_results, admission_from_now()
+        )
+    else:
+        best_fits, next_cursor = await run_compute(
+            bundle.find_similar_articles_page,
+            content["query"],
+            max_results,
+            labels,
+            ef,
+            admission_from_now(),
+        )
+    return paged(request, view.apply(best_fits), bundle, next_cursor)
+
+
+async def recommend_batch(request):
+    try:
+        content = await request.json()
+    except ValueError:
+        content = None
+    queries = content.get("queries") if isinstance(content, dict) else None
+    if not (
+        queries
+        and isinstance(queries, list)
+        and all(isinstance(query, str) for query in queries)
+    ):
+        return FlaskJSONResponse({"error": "A list of queries is required!"}, 400)
+    if len(queries) > MAX_BATCH_QUERIES:
+        return FlaskJSONResponse(
+            {"error": f"Batch should not exceed {MAX_BATCH_QUERIES} queries!"}, 400
+        )
+
+    bundle = service.bundles.active
+    try:
+        max_results, view = page_options(request.query_params)
+        ef, labels = query_options(request.query_params, content, bundle)
+    except ValueError as e:
+        return FlaskJSONResponse({"error": str(e)}, 400)
+
+    best_fits = await run_compute(
+        bundle.find_similar_articles_batch,
+        queries,
+        max_results,
+        labels,
+        ef,
+        admission_from_now(),
+    )
+    best_fits = [view.apply(row) for row in best_fits]
+    return negotiated(
+        request,
+        FlaskJSONResponse(best_fits, headers={"X-Bundle-Version": bundle.version}),
+    )
+
+
+async def similar_to_article(request):
+    try:
+        max_results, view = page_options(request.query_params)
+    except ValueError as e:
+        return FlaskJSONResponse({"error": str(e)}, 400)
+
+    article_id = request.path_params["article_id"]
+    bundle = service.bundles.active
+    if not bundle.article_store.is_live(article_id):
+        return FlaskJSONResponse({"error": "Article not found!"}, 404)
+    # A table lookup, cheap enough to answer on the event loop.
+    best_fits = bundle.find_articles_like(article_id, max_results)
+    return negotiated(
+        request,
+        FlaskJSONResponse(
+            view.apply(best_fits), headers={"X-Bundle-Version": bundle.version}
+        ),
+    )
+
+
+async def cache_stats(request):
+    bundle = service.bundles.active
+    return FlaskJSONResponse(
+        {
+            "embeddings": bundle.embedding_cache.stats(),
+            "results": bundle.result_cache.stats(),
+            "cursors": bundle.cursors.stats(),
+        }
+    )
+
+
+async def clear_cache(request):
+    service.bundles.active.invalidate_caches()
+    return Response(status_code=204)
+
+
+async def load_stats(request):
+    return FlaskJSONResponse(
+        {
+            "admission": service.admission.stats(),
+            "coalescing": service.bundles.active.in_flight.stats(),
+        }
+    )
+
+
+async def bundle_status(request):
+    bundles = service.bundles
+    return FlaskJSONResponse(
+        {"active": bundles.active.describe(), "reload": bundles.reload_status}
+    )
+
+
+async def reload_bundle(request):
+    try:
+        content = await request.json()
+    except ValueError:
+        content = None
+    bundle_dir = content.get("bundle") if isinstance(content, dict) else None
+    if bundle_dir:
+        try:
+            bundle_dir = resolve_bundle_dir(bundle_dir)
+        except ValueError as e:
+            return FlaskJSONResponse({"error": str(e)}, 403)
+        if not os.path.exists(os.path.join(bundle_dir, "bundle.json")):
+            return FlaskJSONResponse({"error": "Bundle not found!"}, 404)
+    if not service.bundles.request_reload(bundle_dir):
+        return FlaskJSONResponse({"error": "A reload is already in progress!"}, 409)
+    return FlaskJSONResponse(service.bundles.reload_status, 202)
+
+
+async def ingest_articles(request):
+    try:
+        content = await request.json()
+    except ValueError:
+        content = None
+    articles = content.get("articles") if isinstance(content, dict) else None
+    if not articles or not all(
+        isinstance(article, dict) and "text" in article for article in articles
+    ):
+        return FlaskJSONResponse(
+            {"error": "A list of articles with a text is required!"}, 400
+        )
+
+    records = [
+        {
+            "Title": str(article.get("title", "")),
+            "Label": str(article.get("label", "")),
+            "Text": str(article["text"]),
+            "URL": str(article.get("url", "")),
+        }
+        for article in articles
+    ]
+    bundle = service.bundles.active
+    ids = await run_compute(bundle.add_articles, records)
+    return FlaskJSONResponse(
+        {"ids": ids}, 201, headers={"X-Bundle-Version": bundle.version}
+    )
+
+
+async def remove_article(request):
+    try:
+        await run_compute(
+            service.bundles.active.delete_articles, [request.path_params["article_id"]]
+        )
+    except KeyError:
+        return FlaskJSONResponse({"error": "Article not found!"}, 404)
+    return Response(status_code=204)
+
+
+async def worker_memory(request):
+    return FlaskJSONResponse(memory_usage())
+
+
+async def ready(request):
+    bundles = service.bundles
+    if not bundles.ready:
+        return FlaskJSONResponse({"ready": False, "load": bundles.reload_status}, 503)
+    return FlaskJSONResponse(
+        {"ready": True, "bundle": bundles.active.version, "startup": bundles.startup}
+    )
+
+
+async def prometheus_metrics(request):
+    return Response(
+        metrics.registry.render(), headers={"Content-Type": metrics.CONTENT_TYPE}
+    )
+
+
+async def base_model_plot(request):
+    return FileResponse(f"{PLOTS_DIR}/base_model_plot.html")
+
+
+async def trained_model_plot(request):
+    return FileResponse(f"{PLOTS_DIR}/trained_model_plot.html")
+
+
+app = Starlette(
+    routes=[
+        Route("/similar-articles", recommend, methods=["POST"]),
+        Route("/similar-articles/batch", recommend_batch, methods=["POST"]),
+        Route(
+            "/articles/{article_id:int}/similar", similar_to_article, methods=["GET"]
+        ),
+        Route("/admin/cache", cache_stats, methods=["GET"]),
+        Route("/admin/cache", clear_cache, methods=["DELETE"]),
+        Route("/admin/load", load_stats, methods=["GET"]),
+        Route("/admin/bundle", bundle_status, methods=["GET"]),
+        Route("/admin/reload", reload_bundle, methods=["POST"]),
+        Route("/admin/articles", ingest_articles, methods=["POST"]),
+        Route("/admin/articles/{article_id:int}", remove_article, methods=["DELETE"]),
+        Route("/admin/memory", worker_memory, methods=["GET"]),
+        Route("/ready", ready, methods=["GET"]),
+        Route("/metrics", prometheus_metrics, methods=["GET"]),
+        Route("/base-model-plot", base_model_plot),
+        Route("/trained-model-plot", trained_model_plot),
+    ],
+    exception_handlers={Overloaded: overloaded},
+    middleware=[
+        Middleware(MetricsMiddleware),
+        Middleware(PublicCORS),
+        Middleware(AdminAuth),
+        Middleware(StartupGate),
+        Middleware(ReloadFollower),
+        Middleware(ArticleSync),
+    ],
+)
@@ -0,0 +1,116 @@
+import os
+import queue
+import threading
+import time
+
+from metrics import ENCODE_BATCH_SIZE
+
+
+class _PendingQuery:
+    __slots__ = ("text", "done", "embedding", "error")
+
+    def __init__(self, text):
+        self.text = text
+        self.done = threading.Event()
+        self.embedding = None
+        self.error = None
+
+
+class BatchEncoder:
+    """
+    Collects queries from concurrent request threads and encodes them with a
+    single model.encode call. A batch is flushed once it reaches
+    max_batch_size or max_wait_ms has passed since its first query arrived.
+    """
+
+    def __init__(self, model, max_batch_size=32, max_wait_ms=5):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.queue = queue.Queue()
+        self.closed = False
+        self._lock = threading.Lock()
+        self._worker_pid = None
+
+    def encode(self, text):
+        return self.encode_many([text])[0]
+
+    def encode_many(self, texts):
+        # The texts are queued together, so they are batched with each other
+        # and with concurrent single queries.
+        pending_queries = [_PendingQuery(text) for text in texts]
+        with self._lock:
+            if self.closed:
+                return list(self.model.encode(texts))
+            self._ensure_worker()
+            for pending in pending_queries:
+                self.queue.put(pending)
+        for pending in pending_queries:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+        return [pending.embedding for pending in pending_queries]
+
+    def close(self):
+        """
+        Stops the worker thread once the queued queries are encoded. Later
+        calls to encode run synchronously on the calling thread.
+        """
+        with self._lock:
+            self.closed = True
+            if self._worker_pid == os.getpid():
+                self.queue.put(None)
+
+    def _ensure_worker(self):
+        # The worker thread is started lazily, and again after a fork, since
+        # threads do not survive into forked server workers.
+        if self._worker_pid == os.getpid():
+            return
+        self.queue = queue.Queue()
+        threading.Thread(target=self._run, name="batch-encoder", daemon=True).start()
+        self._worker_pid = os.getpid()
+
+    def _collect_batch(self, work_queue):
+        # A None item is the close sentinel and is always the last one queued.
+        batch = []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if not batch:
+                    pending = work_queue.get()
+                elif remaining > 0:
+                    pending = work_queue.get(timeout=remaining)
+                else:
+                    pending = work_queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is None:
+                return batch, True
+            batch.append(pending)
+        return batch, False
+
+    def _run(self):
+        work_queue = self.queue
+        stop = False
+        while not stop:
+            batch, stop = self._collect_batch(work_queue)
+            if batch:
+                self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        ENCODE_BATCH_SIZE.observe(len(batch))
+        try:
+            embeddings = self.model.encode(
+                [pending.text for pending in batch], batch_size=len(batch)
+            )
+            # Copy each row so a cached embedding does not keep the whole
+            # batch array alive.
+            for pending, embedding in zip(batch, embeddings):
+                pending.embedding = embedding.copy()
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
@@ -0,0 +1,85 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, api_dir)
+
+from config import MODEL_NAME, ONNX_DIR  # noqa: E402
+from encoders import BACKENDS, load_encoder  # noqa: E402
+
+SAMPLE_QUERIES = [
+    "theori gener rel",
+    "plant convert sunlight energi",
+    "introduct linear algebra vector matric eigenvalu",
+    "caus consequ french revolut",
+    "neural network learn backpropag",
+    "cell divis mitosi meiosi beginn",
+    "plate tecton earthquak volcano",
+    "histori roman empir",
+]
+
+
+def cosine_similarities(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+def measure(encoder, queries, repeats, batch_size):
+    encoder.encode(queries[:1])  # warm-up
+
+    latencies = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        encoder.encode([queries[i % len(queries)]])
+        latencies.append(time.perf_counter() - start)
+
+    batch = (queries * (batch_size // len(queries) + 1))[:batch_size]
+    start = time.perf_counter()
+    encoder.encode(batch, batch_size=batch_size)
+    throughput = batch_size / (time.perf_counter() - start)
+    return statistics.median(latencies) * 1000, throughput
+
+
+def main(args):
+    reference = load_encoder(args.model, "torch", args.threads).to("cpu")
+    expected = reference.encode(SAMPLE_QUERIES)
+
+    print(f"{'backend':<12}{'min cos':>9}{'mean cos':>10}{'p50':>11}{'throughput':>14}")
+    for backend in args.backends:
+        encoder = load_encoder(args.model, backend, args.threads, args.onnx_dir)
+        similarities = cosine_similarities(expected, encoder.encode(SAMPLE_QUERIES))
+        p50, throughput = measure(
+            encoder, SAMPLE_QUERIES, args.repeats, args.batch_size
+        )
+        status = "" if similarities.min() >= args.min_cosine else "  PARITY FAILED"
+        print(
+            f"{backend:<12}{similarities.min():>9.4f}{similarities.mean():>10.4f}"
+            f"{p50:>8.1f} ms{throughput:>10.1f} q/s{status}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check encoder backends against the reference model and time them."
+    )
+    parser.add_argument("--model", type=str, default=MODEL_NAME)
+    parser.add_argument(
+        "--backends", type=str, nargs="+", choices=BACKENDS, default=list(BACKENDS)
+    )
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--onnx-dir", type=str, default=ONNX_DIR)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument(
+        "--min-cosine",
+        type=float,
+        default=0.99,
+        help="Lowest cosine similarity to the reference model that still passes.",
+    )
+    main(parser.parse_args())
@@ -0,0 +1,94 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, api_dir)
+
+from bench_quantization import recall_at_k  # noqa: E402
+from filtered_search import FilteredSearch, LabelIndex  # noqa: E402
+from hnsw_manager import HNSWIndexManager  # noqa: E402
+from quantized_index import normalize_rows  # noqa: E402
+
+
+def timed(search, queries):
+    start = time.perf_counter()
+    found = [search(query)[0][0] for query in queries]
+    return found, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main(args):
+    embeddings = np.load(args.embeddings_path, mmap_mode="r")
+    rng = np.random.default_rng(args.seed)
+    queries = np.asarray(
+        embeddings[rng.choice(len(embeddings), args.num_queries, replace=False)],
+        dtype=np.float32,
+    )
+    # Synthetic labels: "selective" covers args.selectivity of the corpus.
+    labels = np.where(
+        rng.random(len(embeddings)) < args.selectivity, "selective", "other"
+    )
+    label_index = LabelIndex(labels, np.zeros(len(labels), dtype=bool))
+    allowed = labels == "selective"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_path = os.path.join(tmp_dir, "corpus.npy")
+        np.save(corpus_path, np.asarray(embeddings, dtype=np.float32))
+        hnsw = HNSWIndexManager.load_or_build(
+            corpus_path, os.path.join(tmp_dir, "corpus.hnsw")
+        )
+        filtered = FilteredSearch(hnsw, corpus_path, label_index, 0)
+
+        scores = normalize_rows(queries) @ normalize_rows(embeddings).T
+        scores[:, ~allowed] = -np.inf
+        expected = np.argsort(-scores, axis=1)[:, : args.k]
+
+        def post_filter(query):
+            # Baseline: over-fetch a fixed multiple of k, then drop other labels.
+            ids, distances = hnsw.query(query, args.k * args.over_fetch)
+            keep = allowed[ids[0]]
+            return ids[:, keep][:, : args.k], distances[:, keep][:, : args.k]
+
+        runs = {"unfiltered": lambda query: hnsw.query(query, args.k)}
+        runs["post-filter"] = post_filter
+        for name, exact_max_articles in (("subset", len(labels)), ("pushdown", 0)):
+            runs[name] = lambda query, limit=exact_max_articles: (
+                setattr(filtered, "exact_max_articles", limit)
+                or filtered.query(query, args.k, ["selective"])
+            )
+
+        print(
+            f"{len(labels)} vectors, {allowed.sum()} match the filter "
+            f"({args.selectivity:.1%}), k={args.k}"
+        )
+        print(f"{'strategy':<14}{'recall@k':>10}{'latency':>12}")
+        for name, search in runs.items():
+            found, latency = timed(search, queries)
+            recall = "" if name == "unfiltered" else f"{_recall(found, expected):.3f}"
+            print(f"{name:<14}{recall:>10}{latency:>9.2f} ms")
+
+
+def _recall(found, expected):
+    found = [list(ids) + [-1] * (expected.shape[1] - len(ids)) for ids in found]
+    return recall_at_k(found, expected)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare label-filtered search strategies with unfiltered HNSW."
+    )
+    parser.add_argument(
+        "--embeddings-path",
+        type=str,
+        default=os.path.join(api_dir, "embeddings", "embeddings.npy"),
+    )
+    parser.add_argument("--selectivity", type=float, default=0.05)
+    parser.add_argument("--over-fetch", type=int, default=10)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    main(parser.parse_args())
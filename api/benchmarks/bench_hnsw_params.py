@@ -0,0 +1,113 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, api_dir)
+
+from bench_quantization import exact_top_k, recall_at_k  # noqa: E402
+from hnsw_manager import HNSWIndexManager  # noqa: E402
+
+
+def measure_queries(index, queries, k, ef):
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        ids, _ = index.query(query, k, ef=ef)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    latencies = np.array(latencies) * 1000
+    return np.vstack(found), latencies
+
+
+def main(args):
+    embeddings = np.load(args.embeddings_path, mmap_mode="r")
+    rng = np.random.default_rng(args.seed)
+    held_out = rng.choice(len(embeddings), size=args.num_queries, replace=False)
+    mask = np.ones(len(embeddings), dtype=bool)
+    mask[held_out] = False
+    corpus = np.ascontiguousarray(embeddings[mask], dtype=np.float32)
+    queries = np.asarray(embeddings[held_out], dtype=np.float32)
+    expected = exact_top_k(corpus, queries, args.k)
+
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_path = os.path.join(tmp_dir, "corpus.hnsw")
+        for M, ef_construction in itertools.product(args.M, args.ef_construction):
+            start = time.perf_counter()
+            index = HNSWIndexManager(corpus, ef_construction=ef_construction, M=M)
+            build_time = time.perf_counter() - start
+            index.index.save_index(index_path)
+            memory_mb = os.path.getsize(index_path) / 2**20
+
+            for ef in args.ef:
+                found, latencies = measure_queries(index, queries, args.k, ef)
+                reports.append(
+                    {
+                        "M": M,
+                        "ef_construction": ef_construction,
+                        "ef": ef,
+                        "build_s": build_time,
+                        "memory_mb": memory_mb,
+                        "recall": recall_at_k(found, expected),
+                        "p50_ms": float(np.percentile(latencies, 50)),
+                        "p99_ms": float(np.percentile(latencies, 99)),
+                    }
+                )
+
+    print(f"{len(corpus)} vectors, {len(queries)} held-out queries, k={args.k}")
+    print(
+        f"{'M':>4}{'ef_c':>6}{'ef':>6}{'build':>10}{'memory':>11}"
+        f"{'recall@k':>10}{'p50':>10}{'p99':>10}"
+    )
+    for report in reports:
+        print(
+            f"{report['M']:>4}{report['ef_construction']:>6}{report['ef']:>6}"
+            f"{report['build_s']:>9.1f}s{report['memory_mb']:>8.1f} MB"
+            f"{report['recall']:>10.3f}{report['p50_ms']:>7.2f} ms"
+            f"{report['p99_ms']:>7.2f} ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "embeddings": args.embeddings_path,
+                    "vectors": len(corpus),
+                    "queries": len(queries),
+                    "k": args.k,
+                    "results": reports,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sweep HNSW build and search parameters and report their "
+        "build time, memory, latency and recall against exact search."
+    )
+    parser.add_argument(
+        "--embeddings-path",
+        type=str,
+        default=os.path.join(api_dir, "embeddings", "embeddings.npy"),
+    )
+    parser.add_argument("--M", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument(
+        "--ef-construction", type=int, nargs="+", default=[100, 200, 400]
+    )
+    parser.add_argument("--ef", type=int, nargs="+", default=[10, 16, 32, 50, 100, 200])
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, help="Write the report as JSON.")
+    main(parser.parse_args())
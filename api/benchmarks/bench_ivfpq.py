@@ -0,0 +1,88 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, api_dir)
+
+from bench_quantization import evaluate, exact_top_k  # noqa: E402
+from hnsw_manager import HNSWIndexManager  # noqa: E402
+from ivfpq_index import IVFPQIndex  # noqa: E402
+
+
+def main(args):
+    embeddings = np.load(args.embeddings_path, mmap_mode="r")
+    rng = np.random.default_rng(args.seed)
+    held_out = rng.choice(len(embeddings), size=args.num_queries, replace=False)
+    mask = np.ones(len(embeddings), dtype=bool)
+    mask[held_out] = False
+    corpus = np.ascontiguousarray(embeddings[mask], dtype=np.float32)
+    queries = np.asarray(embeddings[held_out], dtype=np.float32)
+    expected = exact_top_k(corpus, queries, args.k)
+
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_path = os.path.join(tmp_dir, "corpus.npy")
+        np.save(corpus_path, corpus)
+
+        start = time.perf_counter()
+        hnsw_path = os.path.join(tmp_dir, "corpus.hnsw")
+        hnsw = HNSWIndexManager.load_or_build(corpus_path, hnsw_path)
+        build_time = time.perf_counter() - start
+        report = evaluate(
+            "hnsw", hnsw, queries, expected, args.k, os.path.getsize(hnsw_path)
+        )
+        reports.append(dict(report, build_s=build_time))
+
+        start = time.perf_counter()
+        ivfpq = IVFPQIndex.load_or_build(
+            corpus_path,
+            os.path.join(tmp_dir, "corpus.ivfpq.npz"),
+            nlist=args.nlist,
+            m=args.m,
+            rerank_candidates=0,
+        )
+        build_time = time.perf_counter() - start
+        for nprobe in args.nprobe:
+            ivfpq.nprobe = nprobe
+            for rerank_candidates in (0, args.rerank_candidates):
+                ivfpq.rerank_candidates = rerank_candidates
+                name = f"ivfpq nprobe={nprobe}" + (
+                    " +rerank" if rerank_candidates else ""
+                )
+                report = evaluate(
+                    name, ivfpq, queries, expected, args.k, ivfpq.memory_bytes()
+                )
+                reports.append(dict(report, build_s=build_time))
+
+    print(f"{len(corpus)} vectors, {len(queries)} held-out queries, k={args.k}")
+    print(f"{'engine':<28}{'resident':>12}{'build':>10}{'recall@k':>10}{'latency':>12}")
+    for report in reports:
+        print(
+            f"{report['engine']:<28}{report['memory_mb']:>9.1f} MB"
+            f"{report['build_s']:>8.1f} s{report['recall']:>10.3f}"
+            f"{report['latency_ms']:>9.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare memory, build time, latency and recall of IVF-PQ and HNSW."
+    )
+    parser.add_argument(
+        "--embeddings-path",
+        type=str,
+        default=os.path.join(api_dir, "embeddings", "embeddings.npy"),
+    )
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--m", type=int, default=48)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--rerank-candidates", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=42)
+    main(parser.parse_args())
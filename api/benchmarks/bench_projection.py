@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, api_dir)
+
+from bench_quantization import evaluate, exact_top_k  # noqa: E402
+from hnsw_manager import HNSWIndexManager  # noqa: E402
+from projected_index import ProjectedIndex, default_projected_index_path  # noqa: E402
+
+
+def main(args):
+    embeddings = np.load(args.embeddings_path, mmap_mode="r")
+    rng = np.random.default_rng(args.seed)
+    held_out = rng.choice(len(embeddings), size=args.num_queries, replace=False)
+    mask = np.ones(len(embeddings), dtype=bool)
+    mask[held_out] = False
+    corpus = np.ascontiguousarray(embeddings[mask], dtype=np.float32)
+    queries = np.asarray(embeddings[held_out], dtype=np.float32)
+    expected = exact_top_k(corpus, queries, args.k)
+
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_path = os.path.join(tmp_dir, "corpus.npy")
+        index_path = os.path.join(tmp_dir, "corpus.hnsw")
+        np.save(corpus_path, corpus)
+
+        start = time.perf_counter()
+        hnsw = HNSWIndexManager.load_or_build(corpus_path, index_path)
+        build_time = time.perf_counter() - start
+        report = evaluate(
+            f"hnsw dim={corpus.shape[1]}",
+            hnsw,
+            queries,
+            expected,
+            args.k,
+            os.path.getsize(index_path),
+        )
+        reports.append(dict(report, dim=corpus.shape[1], build_s=build_time))
+
+        for dim in args.dim:
+            start = time.perf_counter()
+            index = ProjectedIndex.load_or_build(
+                corpus_path, index_path, dim=dim, rebuild=True
+            )
+            build_time = time.perf_counter() - start
+            graph_bytes = os.path.getsize(default_projected_index_path(index_path))
+            explained = float(index.projection.explained_variance.sum())
+            # Re-scoring only k candidates keeps the graph's own top k, which
+            # shows the recall lost to the projection alone.
+            for rerank_candidates in (args.k, args.rerank_candidates):
+                index.rerank_candidates = rerank_candidates
+                name = f"projected dim={dim}" + (
+                    f" +rerank {rerank_candidates}"
+                    if rerank_candidates > args.k
+                    else ""
+                )
+                report = evaluate(name, index, queries, expected, args.k, graph_bytes)
+                reports.append(
+                    dict(
+                        report,
+                        dim=dim,
+                        rerank_candidates=rerank_candidates,
+                        explained_variance=explained,
+                        build_s=build_time,
+                    )
+                )
+
+    print(f"{len(corpus)} vectors, {len(queries)} held-out queries, k={args.k}")
+    print(
+        f"{'engine':<32}{'variance':>10}{'index':>12}{'build':>10}"
+        f"{'recall@k':>10}{'latency':>12}"
+    )
+    for report in reports:
+        variance = report.get("explained_variance")
+        print(
+            f"{report['engine']:<32}"
+            f"{f'{variance:.1%}' if variance is not None else '-':>10}"
+            f"{report['memory_mb']:>9.1f} MB{report['build_s']:>8.1f} s"
+            f"{report['recall']:>10.3f}{report['latency_ms']:>9.2f} ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "embeddings": args.embeddings_path,
+                    "vectors": len(corpus),
+                    "queries": len(queries),
+                    "k": args.k,
+                    "results": reports,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare recall, latency and index size of HNSW over "
+        "projected embeddings at each dimension with full-dimension HNSW."
+    )
+    parser.add_argument(
+        "--embeddings-path",
+        type=str,
+        default=os.path.join(api_dir, "embeddings", "embeddings.npy"),
+    )
+    parser.add_argument("--dim", type=int, nargs="+", default=[64, 128, 256])
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--rerank-candidates", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, help="Write the report as JSON.")
+    main(parser.parse_args())
@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, api_dir)
+
+from hnsw_manager import HNSWIndexManager  # noqa: E402
+from quantized_index import QuantizedIndex, normalize_rows  # noqa: E402
+
+
+def exact_top_k(corpus, queries, k):
+    scores = normalize_rows(queries) @ normalize_rows(corpus).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def recall_at_k(found, expected):
+    hits = sum(len(set(f) & set(e)) for f, e in zip(found, expected))
+    return hits / expected.size
+
+
+def evaluate(name, index, queries, expected, k, memory_bytes):
+    start = time.perf_counter()
+    found = np.vstack([index.query(query, k)[0] for query in queries])
+    latency = (time.perf_counter() - start) / len(queries)
+    return {
+        "engine": name,
+        "memory_mb": memory_bytes / 2**20,
+        "recall": recall_at_k(found, expected),
+        "latency_ms": latency * 1000,
+    }
+
+
+def main(args):
+    embeddings = np.load(args.embeddings_path, mmap_mode="r")
+    rng = np.random.default_rng(args.seed)
+    held_out = rng.choice(len(embeddings), size=args.num_queries, replace=False)
+    mask = np.ones(len(embeddings), dtype=bool)
+    mask[held_out] = False
+    corpus = np.ascontiguousarray(embeddings[mask], dtype=np.float32)
+    queries = np.asarray(embeddings[held_out], dtype=np.float32)
+    expected = exact_top_k(corpus, queries, args.k)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_path = os.path.join(tmp_dir, "corpus.npy")
+        index_path = os.path.join(tmp_dir, "corpus.hnsw")
+        np.save(corpus_path, corpus)
+
+        hnsw = HNSWIndexManager.load_or_build(corpus_path, index_path)
+        # The graph holds its own float32 copy of every vector.
+        reports = [
+            evaluate(
+                "hnsw (float32)",
+                hnsw,
+                queries,
+                expected,
+                args.k,
+                os.path.getsize(index_path),
+            )
+        ]
+        for precision in ("float16", "int8"):
+            index = QuantizedIndex(
+                corpus_path, precision, rerank_candidates=args.rerank_candidates
+            )
+            reports.append(
+                evaluate(
+                    f"quantized ({precision})",
+                    index,
+                    queries,
+                    expected,
+                    args.k,
+                    index.memory_bytes(),
+                )
+            )
+
+    print(f"{len(corpus)} vectors, {len(queries)} held-out queries, k={args.k}")
+    print(f"{'engine':<18}{'resident':>12}{'recall@k':>10}{'latency':>12}")
+    for report in reports:
+        print(
+            f"{report['engine']:<18}{report['memory_mb']:>9.1f} MB"
+            f"{report['recall']:>10.3f}{report['latency_ms']:>9.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare memory and recall of the quantized index with HNSW."
+    )
+    parser.add_argument(
+        "--embeddings-path",
+        type=str,
+        default=os.path.join(api_dir, "embeddings", "embeddings.npy"),
+    )
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--rerank-candidates", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=42)
+    main(parser.parse_args())
@@ -0,0 +1,106 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, api_dir)
+
+from serialization import ResponseView, brotli, dumps  # noqa: E402
+
+
+def sample_responses(args):
+    # Real articles when the store exists, otherwise synthetic 250+ word texts.
+    rng = np.random.default_rng(args.seed)
+    if os.path.exists(os.path.join(args.articles_dir, "meta.json")):
+        from article_store import ArticleStore
+
+        store = ArticleStore(args.articles_dir)
+        articles = [store.get(int(i)) for i in rng.integers(len(store), size=64)]
+    else:
+        words = ["quantum", "history", "enzyme", "lattice", "empire", "algebra"]
+        articles = [
+            {
+                "Title": f"Article {i}",
+                "Label": "Physics",
+                "Text": " ".join(rng.choice(words, size=rng.integers(250, 2000))),
+                "URL": f"https://en.wikipedia.org/wiki/Article_{i}",
+            }
+            for i in range(64)
+        ]
+
+    responses = []
+    for _ in range(args.num_responses):
+        hits = rng.choice(len(articles), size=args.max_results, replace=False)
+        responses.append(
+            [
+                {
+                    "id": int(i),
+                    "title": articles[i]["Title"],
+                    "label": articles[i]["Label"],
+                    "text": articles[i]["Text"],
+                    "url": articles[i]["URL"],
+                    "distance": float(rng.random()),
+                }
+                for i in hits
+            ]
+        )
+    return responses
+
+
+def measure(responses, encode):
+    start = time.perf_counter()
+    sizes = [len(encode(response)) for response in responses]
+    elapsed = (time.perf_counter() - start) / len(responses)
+    return float(np.mean(sizes)), elapsed * 1e6
+
+
+def main(args):
+    responses = sample_responses(args)
+    snippet = ResponseView(snippet_chars=args.snippet)
+    projected = ResponseView(fields=("id", "title", "url", "distance"))
+
+    def stdlib_json(response):
+        body = json.dumps(response, sort_keys=True, separators=(",", ":"))
+        return f"{body}\n".encode()
+
+    variants = {
+        "json full": stdlib_json,
+        "orjson full": dumps,
+        f"orjson snippet={args.snippet}": lambda r: dumps(snippet.apply(r)),
+        "orjson id,title,url,distance": lambda r: dumps(projected.apply(r)),
+        "orjson full + gzip": lambda r: gzip.compress(dumps(r), 6, mtime=0),
+        f"orjson snippet={args.snippet} + gzip": lambda r: gzip.compress(
+            dumps(snippet.apply(r)), 6, mtime=0
+        ),
+    }
+    if brotli is not None:
+        variants["orjson full + brotli"] = lambda r: brotli.compress(
+            dumps(r), quality=4
+        )
+
+    print(f"{len(responses)} responses of {args.max_results} hits")
+    print(f"{'variant':<32}{'bytes':>10}{'time':>14}")
+    for name, encode in variants.items():
+        size, micros = measure(responses, encode)
+        print(f"{name:<32}{size:>10.0f}{micros:>11.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare response size and serialization time per response."
+    )
+    parser.add_argument(
+        "--articles-dir",
+        type=str,
+        default=os.path.join(api_dir, "data", "articles"),
+    )
+    parser.add_argument("--num-responses", type=int, default=1000)
+    parser.add_argument("--max-results", type=int, default=4)
+    parser.add_argument("--snippet", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    main(parser.parse_args())
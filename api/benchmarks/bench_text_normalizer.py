@@ -0,0 +1,95 @@
+import argparse
+import os
+import string
+import sys
+import time
+
+import nltk
+import pandas as pd
+from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer, WordNetLemmatizer
+
+api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, api_dir)
+
+from utils import TextNormalizer  # noqa: E402
+
+SAMPLE_QUERIES = [
+    "What is the theory of general relativity?",
+    "How do plants convert sunlight into energy?",
+    "Introduction to linear algebra: vectors, matrices and eigenvalues.",
+    "The causes and consequences of the French Revolution",
+    "Explain how neural networks learn with backpropagation.",
+    "Cell division, mitosis and meiosis for beginners",
+]
+
+
+def reference_process_text(text):
+    # The original per-call implementation, kept as the parity reference.
+    text = text.lower()
+
+    table = str.maketrans("", "", string.punctuation)
+    text = text.translate(table)
+
+    words = nltk.word_tokenize(text)
+
+    stop_words = set(stopwords.words("english"))
+    words = [word for word in words if word not in stop_words]
+
+    stemmer = PorterStemmer()
+    lemmatizer = WordNetLemmatizer()
+
+    words_stemmed_lemmatized = [
+        lemmatizer.lemmatize(stemmer.stem(word)) for word in words
+    ]
+
+    return " ".join(words_stemmed_lemmatized)
+
+
+def load_texts(data_path, limit):
+    if data_path and os.path.exists(data_path):
+        texts = pd.read_excel(data_path)["Text"].astype(str).tolist()
+    else:
+        texts = list(SAMPLE_QUERIES)
+    return (texts * (limit // len(texts) + 1))[:limit]
+
+
+def timed(fn, texts):
+    start = time.perf_counter()
+    outputs = fn(texts)
+    return outputs, time.perf_counter() - start
+
+
+def main(args):
+    texts = load_texts(args.data_path, args.num_texts)
+    normalizer = TextNormalizer()
+
+    expected, reference_time = timed(
+        lambda batch: [reference_process_text(text) for text in batch], texts
+    )
+    actual, normalizer_time = timed(normalizer.normalize_batch, texts)
+
+    mismatches = [i for i, (a, b) in enumerate(zip(expected, actual)) if a != b]
+    if mismatches:
+        print(f"Parity FAILED for {len(mismatches)} of {len(texts)} texts.")
+        print(f"First mismatch: {texts[mismatches[0]]!r}")
+        sys.exit(1)
+
+    print(f"Parity OK on {len(texts)} texts.")
+    print(f"process_text (reference): {reference_time * 1000:.1f} ms")
+    print(f"TextNormalizer:           {normalizer_time * 1000:.1f} ms")
+    print(f"Speedup:                  {reference_time / normalizer_time:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check TextNormalizer against process_text and time both."
+    )
+    parser.add_argument(
+        "--data-path",
+        type=str,
+        default=os.path.join(api_dir, "data", "data.xlsx"),
+        help="Excel file with a Text column. Falls back to sample queries.",
+    )
+    parser.add_argument("--num-texts", type=int, default=2000)
+    main(parser.parse_args())
@@ -0,0 +1,361 @@
+import argparse
+import json
+import os
+import random
+import shlex
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+import requests
+
+from startup_report import wait_until_ready
+
+api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUERIES = [
+    "What is the theory of general relativity?",
+    "How do plants convert sunlight into energy?",
+    "Introduction to linear algebra",
+    "The causes of the French Revolution",
+    "How do neural networks learn?",
+    "Cell division and mitosis",
+    "Plate tectonics and earthquakes",
+    "The history of the Roman Empire",
+]
+
+# Query mixes:
+# - unique: every query is new, so every request encodes and searches.
+# - repeated: a few popular queries with Zipf-like frequencies, so most
+#   requests hit the caches or coalesce.
+# - varied: unique queries with random maxResults, accuracy and fields.
+# - paged: a first page followed by the next one through its cursor.
+MIXES = ("unique", "repeated", "varied", "paged")
+
+# Report fields where a higher value is better; for the others lower is better.
+HIGHER_IS_BETTER = {"throughput_rps"}
+COMPARED_FIELDS = (
+    "throughput_rps",
+    "p50_ms",
+    "p95_ms",
+    "p99_ms",
+    "cpu_ms_per_request",
+    "peak_rss_mb",
+)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+class ProcessSampler:
+    """
+    Measures the CPU time and the peak memory of a server process and all of
+    its children, e.g. gunicorn workers, while a load test runs.
+    """
+
+    def __init__(self, pid, interval=0.5):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_pss = None
+        self._stop = threading.Event()
+
+    def _tree(self):
+        return [self.process] + self.process.children(recursive=True)
+
+    def _cpu_seconds(self):
+        total = 0.0
+        for process in self._tree():
+            try:
+                times = process.cpu_times()
+                total += times.user + times.system
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    def _sample(self):
+        rss, pss = 0, 0
+        for process in self._tree():
+            try:
+                info = process.memory_full_info()
+            except psutil.NoSuchProcess:
+                continue
+            rss += info.rss
+            pss += getattr(info, "pss", 0)
+        self.peak_rss = max(self.peak_rss, rss)
+        if pss:
+            self.peak_pss = max(self.peak_pss or 0, pss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._cpu_start = self._cpu_seconds()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        self.cpu_seconds = self._cpu_seconds() - self._cpu_start
+
+
+def request_sender(session, base_url, mix, max_results, seed):
+    popular = [1 / rank for rank in range(1, len(QUERIES) + 1)]
+
+    def post(params, query, cursor=None):
+        if cursor is not None:
+            params = dict(params, cursor=cursor)
+        start = time.perf_counter()
+        response = session.post(
+            f"{base_url}/similar-articles",
+            params=params,
+            json=None if cursor is not None else {"query": query},
+        )
+        return response, time.perf_counter() - start
+
+    def send(i):
+        # Seeded per request, so a mix sends the same requests on every run.
+        rng = random.Random(seed * 1_000_003 + i)
+        params = {"maxResults": max_results}
+        query = f"{rng.choice(QUERIES)} {i}"
+        if mix == "repeated":
+            query = rng.choices(QUERIES, weights=popular)[0]
+        elif mix == "varied":
+            params["maxResults"] = rng.randint(1, 4)
+            accuracy = rng.choice([None, "fast", "balanced", "accurate"])
+            if accuracy:
+                params["accuracy"] = accuracy
+            if rng.random() < 0.5:
+                params["fields"] = "id,title,url,distance"
+
+        response, latency = post(params, query)
+        results = [(response.status_code, latency)]
+        cursor = response.headers.get("X-Next-Cursor")
+        if mix == "paged" and cursor:
+            response, latency = post(params, query, cursor)
+            results.append((response.status_code, latency))
+        return results
+
+    return send
+
+
+def run(base_url, num_requests, concurrency, max_results, mix="unique", pid=None):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    send = request_sender(session, base_url, mix, max_results, seed=42)
+
+    sampler = ProcessSampler(pid) if pid else None
+    if sampler:
+        sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        batches = list(pool.map(send, range(num_requests)))
+    elapsed = time.perf_counter() - start
+    if sampler:
+        sampler.stop()
+    results = [result for batch in batches for result in batch]
+
+    latencies = [latency for _, latency in results]
+    report = {
+        "url": base_url,
+        "mix": mix,
+        "requests": len(results),
+        "concurrency": concurrency,
+        "errors": sum(status != 200 for status, _ in results),
+        "shed": sum(status == 503 for status, _ in results),
+        "throughput_rps": len(results) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+    if sampler:
+        report.update(
+            cpu_seconds=sampler.cpu_seconds,
+            cpu_utilization=sampler.cpu_seconds / elapsed,
+            cpu_ms_per_request=sampler.cpu_seconds / len(results) * 1000,
+            peak_rss_mb=sampler.peak_rss / 2**20,
+            peak_pss_mb=sampler.peak_pss / 2**20 if sampler.peak_pss else None,
+        )
+    return report
+
+
+def find_regressions(reports, baseline, tolerance):
+    # Runs are matched on their URL and mix; a field regresses when it is
+    # worse than the baseline by more than the relative tolerance.
+    previous = {(report["url"], report["mix"]): report for report in baseline}
+    regressions = []
+    for report in reports:
+        before = previous.get((report["url"], report["mix"]))
+        if before is None:
+            continue
+        for field in COMPARED_FIELDS:
+            if report.get(field) is None or not before.get(field):
+                continue
+            change = (report[field] - before[field]) / before[field]
+            if field in HIGHER_IS_BETTER:
+                change = -change
+            if change > tolerance:
+                regressions.append(
+                    {
+                        "url": report["url"],
+                        "mix": report["mix"],
+                        "field": field,
+                        "baseline": before[field],
+                        "value": report[field],
+                        "worse_by": change,
+                    }
+                )
+    return regressions
+
+
+def launch(command, bundle_dir, base_url, timeout):
+    """
+    Starts a server from the api directory, serving bundle_dir with the stub
+    encoder when given, and returns the process once GET /ready succeeds.
+    """
+    env = dict(os.environ)
+    if bundle_dir:
+        with open(os.path.join(bundle_dir, "bundle.json")) as f:
+            metadata = json.load(f).get("metadata", {})
+        env.update(
+            SYNAPTIC_BUNDLE_PATH=os.path.abspath(bundle_dir),
+            SYNAPTIC_ENCODER_BACKEND="stub",
+            SYNAPTIC_STUB_ENCODER_DIM=str(metadata.get("dim", 768)),
+        )
+    server = subprocess.Popen(shlex.split(command), cwd=api_dir, env=env)
+    try:
+        wait_until_ready(base_url, timeout)
+    except BaseException:
+        server.terminate()
+        raise
+    return server
+
+
+def main(args):
+    server = None
+    pid = args.pid
+    if args.launch:
+        server = launch(args.launch, args.bundle, args.url[0], args.timeout)
+        pid = server.pid
+
+    reports = []
+    try:
+        for base_url in args.url:
+            for mix in args.mix:
+                report = run(
+                    base_url,
+                    args.requests,
+                    args.concurrency,
+                    args.max_results,
+                    mix,
+                    pid,
+                )
+                reports.append(report)
+                line = (
+                    f"{report['url']} {mix}: {report['throughput_rps']:.1f} req/s, "
+                    f"p50 {report['p50_ms']:.1f} ms, p95 {report['p95_ms']:.1f} ms, "
+                    f"p99 {report['p99_ms']:.1f} ms, {report['errors']} errors"
+                )
+                if "cpu_seconds" in report:
+                    line += (
+                        f", {report['cpu_utilization']:.0%} CPU, "
+                        f"peak {report['peak_rss_mb']:.0f} MB rss"
+                    )
+                print(line)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["runs"]
+        regressions = find_regressions(reports, baseline, args.tolerance)
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['url']} {regression['mix']} "
+                f"{regression['field']}: {regression['baseline']:.2f} -> "
+                f"{regression['value']:.2f} ({regression['worse_by']:+.0%})"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "config": {
+                        "requests": args.requests,
+                        "concurrency": args.concurrency,
+                        "max_results": args.max_results,
+                        "launch": args.launch,
+                        "bundle": args.bundle,
+                    },
+                    "started_at": time.time(),
+                    "runs": reports,
+                    "regressions": regressions,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Wrote {args.output}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load-test /similar-articles on running or launched servers, "
+        "and flag regressions against a previous report."
+    )
+    parser.add_argument(
+        "--url",
+        action="append",
+        help="Base URL of a running server, e.g. http://127.0.0.1:5000. "
+        "Pass it once per server to compare.",
+    )
+    parser.add_argument(
+        "--launch",
+        type=str,
+        help="Command that starts the server from the api directory, e.g. "
+        "'gunicorn -c gunicorn.conf.py app:app' or "
+        "'uvicorn asgi:app --port 5000'. It is stopped after the run.",
+    )
+    parser.add_argument(
+        "--bundle",
+        type=str,
+        help="Bundle directory the launched server serves with the stub "
+        "encoder, e.g. one written by synthetic_corpus.py.",
+    )
+    parser.add_argument(
+        "--pid",
+        type=int,
+        help="PID of a running server, to report its CPU time and memory.",
+    )
+    parser.add_argument("--mix", type=str, nargs="+", choices=MIXES, default=["unique"])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-results", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", type=str, default=None, help="JSON report path.")
+    parser.add_argument(
+        "--baseline", type=str, help="JSON report of a previous run to compare to."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Relative change beyond which a field counts as a regression.",
+    )
+    args = parser.parse_args()
+    args.url = args.url or ["http://127.0.0.1:5000"]
+    sys.exit(main(args))
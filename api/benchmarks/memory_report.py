@@ -0,0 +1,39 @@
+import argparse
+
+import psutil
+
+
+def format_mb(value):
+    return "n/a" if value is None else f"{value / 2**20:.1f} MB"
+
+
+def main(args):
+    master = psutil.Process(args.pid)
+    processes = [master] + master.children(recursive=True)
+
+    totals = {"rss": 0, "uss": 0, "pss": 0}
+    print(f"{'pid':>8}  {'rss':>12}  {'uss':>12}  {'pss':>12}")
+    for process in processes:
+        info = process.memory_full_info()
+        usage = {key: getattr(info, key, None) for key in totals}
+        for key in totals:
+            totals[key] += usage[key] or 0
+        print(
+            f"{process.pid:>8}  {format_mb(usage['rss']):>12}"
+            f"  {format_mb(usage['uss']):>12}  {format_mb(usage['pss']):>12}"
+        )
+
+    # The pss total is the real footprint of the server, since shared pages
+    # are only counted once across all processes.
+    print(
+        f"{'total':>8}  {format_mb(totals['rss']):>12}"
+        f"  {format_mb(totals['uss']):>12}  {format_mb(totals['pss']):>12}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report the resident memory of a server and its workers."
+    )
+    parser.add_argument("pid", type=int, help="PID of the gunicorn master process.")
+    main(parser.parse_args())
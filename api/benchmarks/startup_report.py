@@ -0,0 +1,62 @@
+import argparse
+import json
+import time
+
+import requests
+
+
+def wait_until_ready(base_url, timeout):
+    # Polls /ready, tolerating refused connections while the server starts.
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = requests.get(f"{base_url}/ready", timeout=5)
+            if response.status_code == 200:
+                return response.json()
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"{base_url} was not ready within {timeout}s")
+
+
+def main(args):
+    report = wait_until_ready(args.url, args.timeout)
+
+    start = time.perf_counter()
+    response = requests.post(
+        f"{args.url}/similar-articles", json={"query": args.query}, timeout=30
+    )
+    response.raise_for_status()
+    first_query = time.perf_counter() - start
+
+    startup = report["startup"]
+    print(f"Bundle {report['bundle']}")
+    for phase, seconds in startup["phases"].items():
+        print(f"{phase:<16}{seconds:>9.2f} s")
+    print(f"{'ready after':<16}{startup['seconds_to_ready']:>9.2f} s")
+    print(f"{'first query':<16}{first_query * 1000:>9.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "bundle": report["bundle"],
+                    "phases": startup["phases"],
+                    "seconds_to_ready": startup["seconds_to_ready"],
+                    "first_query_ms": first_query * 1000,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report the startup phases of a server and its first query latency."
+    )
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:5000")
+    parser.add_argument("--query", type=str, default="introduction to physics")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", type=str, help="Write the report as JSON.")
+    main(parser.parse_args())
@@ -0,0 +1,105 @@
+import argparse
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, api_dir)
+
+from article_store import ArticleStore  # noqa: E402
+from corpus_embeddings import EmbeddingsBuilder  # noqa: E402
+from encoders import StubEncoder  # noqa: E402
+
+LABELS = ["Physics", "Biology", "History", "Mathematics", "Chemistry", "Geography"]
+
+
+def vocabulary(size, rng):
+    # Pronounceable pseudo-words, so the text normalizer has real work to do.
+    consonants = list("bcdfghklmnprstvz")
+    vowels = list("aeiou")
+    words = set()
+    while len(words) < size:
+        syllables = rng.integers(1, 4)
+        words.add(
+            "".join(
+                rng.choice(consonants) + rng.choice(vowels) for _ in range(syllables)
+            )
+        )
+    return sorted(words)
+
+
+def synthetic_records(count, min_words, max_words, seed=42):
+    rng = np.random.default_rng(seed)
+    words = np.array(vocabulary(5000, rng))
+    # Zipf-distributed word frequencies, like natural text.
+    weights = 1 / np.arange(1, len(words) + 1)
+    weights /= weights.sum()
+    records = []
+    for i in range(count):
+        text = rng.choice(words, size=rng.integers(min_words, max_words), p=weights)
+        records.append(
+            {
+                "Title": " ".join(text[:4]).title(),
+                "Label": LABELS[rng.integers(len(LABELS))],
+                "Text": " ".join(text),
+                "URL": f"https://example.org/articles/{i}",
+            }
+        )
+    return records
+
+
+def write_bundle(bundle_dir, count, dim, min_words=50, max_words=400, seed=42):
+    """
+    Writes a serving bundle with a synthetic article store and its embeddings
+    encoded by the stub encoder, to serve with SYNAPTIC_ENCODER_BACKEND=stub
+    and SYNAPTIC_STUB_ENCODER_DIM=dim. The index is built on first load.
+    """
+    os.makedirs(bundle_dir, exist_ok=True)
+    store = ArticleStore.write(
+        synthetic_records(count, min_words, max_words, seed),
+        os.path.join(bundle_dir, "articles"),
+    )
+    EmbeddingsBuilder(
+        StubEncoder(dim), "stub", store, os.path.join(bundle_dir, "embeddings.npy")
+    ).build()
+    with open(os.path.join(bundle_dir, "bundle.json"), "w") as f:
+        json.dump(
+            {
+                "version": f"synthetic-{count}",
+                "model": "stub",
+                "embeddings": "embeddings.npy",
+                "index": "embeddings.hnsw",
+                "articles": "articles",
+                "metadata": {"dim": dim, "seed": seed},
+            },
+            f,
+            indent=2,
+        )
+    return bundle_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic serving bundle for offline benchmarks."
+    )
+    parser.add_argument("bundle_dir", type=str)
+    parser.add_argument("--articles", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--min-words", type=int, default=50)
+    parser.add_argument("--max-words", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    write_bundle(
+        args.bundle_dir,
+        args.articles,
+        args.dim,
+        args.min_words,
+        args.max_words,
+        args.seed,
+    )
+    print(f"Wrote {args.articles} synthetic articles to {args.bundle_dir}")
@@ -0,0 +1,763 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from article_store import ArticleStore
+from batching import BatchEncoder
+from cache import LRUCache, SingleFlight
+from config import (
+    ARTICLES_DIR,
+    BUNDLES_ROOT,
+    CURSOR_CACHE_SIZE,
+    CURSOR_TTL_SECONDS,
+    DATA_PATH,
+    EMBEDDINGS_PATH,
+    ENCODE_BATCH_WAIT_MS,
+    ENCODE_MAX_BATCH_SIZE,
+    ENCODER_BACKEND,
+    ENCODER_THREADS,
+    EXACT_SEARCH_MAX_ARTICLES,
+    FILTER_BLOCK_CACHE_BYTES,
+    FILTER_EXACT_MAX_ARTICLES,
+    HNSW_EF,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_M,
+    HNSW_NUM_THREADS,
+    INDEX_ENGINE,
+    INDEX_PATH,
+    INGEST_BATCH_SIZE,
+    IVF_NLIST,
+    IVF_NPROBE,
+    MODEL_NAME,
+    NEIGHBOR_COUNT,
+    ONNX_DIR,
+    PAGE_CANDIDATES,
+    PQ_M,
+    PROJECTION_DIM,
+    QUANTIZATION,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL_SECONDS,
+    RERANK_CANDIDATES,
+    RELOAD_CONTROL_PATH,
+    RESULT_CACHE_SIZE,
+    WARMUP_QUERY,
+)
+from corpus_embeddings import verify_manifest
+from encoders import load_encoder
+from exact_engine import ExactSearchEngine
+from filtered_search import FilteredSearch, LabelIndex
+from hnsw_manager import HNSWIndexManager
+from ivfpq_index import IVFPQIndex, default_ivfpq_path
+from projected_index import ProjectedIndex
+from ingest import (
+    add_articles,
+    catch_up,
+    delete_articles,
+    embeddings_fingerprint,
+    write_lock,
+)
+from metrics import stage, timed
+from neighbors import NeighborTable
+from pagination import Cursor
+from quantized_index import QuantizedIndex
+from search_engine import fastest_engine, sample_queries
+from utils import process_started_at, process_text
+
+logger = logging.getLogger(__name__)
+
+
+def run_now(fn, *args):
+    return fn(*args)
+
+
+def _inside(path, directory):
+    directory = os.path.realpath(directory)
+    return os.path.commonpath([directory, os.path.realpath(path)]) == directory
+
+
+def resolve_bundle_dir(bundle_dir, root=BUNDLES_ROOT):
+    """
+    Returns the path of a bundle directory given relative to the bundles
+    root. Raises ValueError when no root is configured or the directory is
+    outside it.
+    """
+    if not root:
+        raise ValueError("Only the active bundle can be reloaded!")
+    path = os.path.join(root, bundle_dir)
+    if not _inside(path, root):
+        raise ValueError("Bundles must be inside the bundles root!")
+    return os.path.realpath(path)
+
+
+class ServingBundle:
+    """
+    Everything a version of the service needs to answer queries: the model,
+    the embeddings and index built with it, the article store and the caches
+    derived from them. A bundle directory holds a bundle.json such as
+
+        {
+            "version": "2024-06-01",
+            "model": "models/mpnet-setfit",
+            "embeddings": "embeddings.npy",
+            "index": "embeddings.hnsw",
+            "articles": "articles",
+            "metadata": {"notes": "retrained on the arXiv subset"}
+        }
+
+    where relative paths are resolved against the bundle directory.
+    """
+
+    def __init__(
+        self,
+        version,
+        model_name,
+        embeddings_path,
+        index_path,
+        articles_dir,
+        data_path=None,
+        metadata=None,
+    ):
+        self.version = version
+        self.model_name = model_name
+        self.embeddings_path = embeddings_path
+        self.index_path = index_path
+        self.articles_dir = articles_dir
+        self.data_path = data_path
+        self.metadata = metadata or {}
+        self.loaded_at = None
+        # Seconds spent in each phase of load() and warm_up().
+        self.load_timings = {}
+
+    @classmethod
+    def from_config(cls):
+        return cls(
+            "default",
+            MODEL_NAME,
+            EMBEDDINGS_PATH,
+            INDEX_PATH,
+            ARTICLES_DIR,
+            data_path=DATA_PATH,
+        )
+
+    @classmethod
+    def from_path(cls, bundle_dir, confined=False):
+        """
+        Reads a bundle directory. When confined, local paths in bundle.json
+        must stay inside the directory, as for bundles loaded on request.
+        """
+        with open(os.path.join(bundle_dir, "bundle.json")) as f:
+            manifest = json.load(f)
+
+        def resolve(path):
+            path = path if os.path.isabs(path) else os.path.join(bundle_dir, path)
+            if confined and not _inside(path, bundle_dir):
+                raise ValueError(f"{path} is outside the bundle directory!")
+            return path
+
+        # Hub model ids are kept as-is; only existing local paths are resolved.
+        model_name = manifest["model"]
+        local_model = (
+            model_name
+            if os.path.isabs(model_name)
+            else os.path.join(bundle_dir, model_name)
+        )
+        if os.path.exists(local_model):
+            model_name = resolve(model_name)
+
+        return cls(
+            manifest["version"],
+            model_name,
+            resolve(manifest.get("embeddings", "embeddings.npy")),
+            resolve(manifest.get("index", "embeddings.hnsw")),
+            resolve(manifest.get("articles", "articles")),
+            data_path=resolve(manifest["data"]) if "data" in manifest else None,
+            metadata=manifest.get("metadata"),
+        )
+
+    def load(self):
+        timings = self.load_timings
+        with timed(timings, "article_store"):
+            if self.data_path:
+                self.article_store = ArticleStore.open_or_convert(
+                    self.articles_dir, self.data_path
+                )
+            else:
+                self.article_store = ArticleStore(self.articles_dir)
+        with timed(timings, "manifest"):
+            # Hashed once; the manifest and every artifact check reuse it.
+            embeddings_sha256 = embeddings_fingerprint(self.embeddings_path)
+            verify_manifest(
+                self.embeddings_path,
+                self.model_name,
+                self.article_store,
+                embeddings_sha256,
+            )
+
+        with timed(timings, "model"):
+            self.model = load_encoder(
+                self.model_name, ENCODER_BACKEND, ENCODER_THREADS, ONNX_DIR
+            )
+        self.encoder = BatchEncoder(
+            self.model,
+            max_batch_size=ENCODE_MAX_BATCH_SIZE,
+            max_wait_ms=ENCODE_BATCH_WAIT_MS,
+        )
+
+        with timed(timings, "index"):
+            self.index = self.load_index(embeddings_sha256)
+        with timed(timings, "neighbors"):
+            self.neighbors = NeighborTable.load_or_build(
+                self.index,
+                self.embeddings_path,
+                top_n=NEIGHBOR_COUNT,
+                embeddings_sha256=embeddings_sha256,
+            )
+        with timed(timings, "labels"):
+            self.labels = LabelIndex.from_store(self.article_store)
+            self.filtered_search = FilteredSearch(
+                self.index,
+                self.embeddings_path,
+                self.labels,
+                FILTER_EXACT_MAX_ARTICLES,
+                FILTER_BLOCK_CACHE_BYTES,
+            )
+
+        ttl = QUERY_CACHE_TTL_SECONDS or None
+        self.embedding_cache = LRUCache(QUERY_CACHE_SIZE, ttl=ttl)
+        self.result_cache = LRUCache(RESULT_CACHE_SIZE, ttl=ttl)
+        # Candidate lists of paginated searches, by cursor token.
+        self.cursors = LRUCache(CURSOR_CACHE_SIZE, ttl=CURSOR_TTL_SECONDS or None)
+        self.in_flight = SingleFlight()
+        # Store rows and deleted flags the label index and caches reflect.
+        self.store_version = self.article_store.version()
+        self._synced_rows = len(self.article_store)
+        self._synced_deleted = self.article_store.deleted
+        self._sync_lock = threading.Lock()
+        self.loaded_at = time.time()
+        return self
+
+    def load_index(self, embeddings_sha256=None):
+        deleted_ids = self.article_store.deleted_ids()
+        if INDEX_ENGINE == "quantized":
+            index = QuantizedIndex(
+                self.embeddings_path,
+                precision=QUANTIZATION,
+                rerank_candidates=RERANK_CANDIDATES,
+            )
+        elif INDEX_ENGINE == "exact":
+            index = ExactSearchEngine(self.embeddings_path)
+        elif INDEX_ENGINE == "ivfpq":
+            return IVFPQIndex.load_or_build(
+                self.embeddings_path,
+                default_ivfpq_path(self.index_path),
+                nlist=IVF_NLIST,
+                m=PQ_M,
+                nprobe=IVF_NPROBE,
+                rerank_candidates=RERANK_CANDIDATES,
+                deleted_ids=deleted_ids,
+                embeddings_sha256=embeddings_sha256,
+            )
+        elif INDEX_ENGINE == "projected":
+            return ProjectedIndex.load_or_build(
+                self.embeddings_path,
+                self.index_path,
+                dim=PROJECTION_DIM,
+                ef_construction=HNSW_EF_CONSTRUCTION,
+                M=HNSW_M,
+                ef=HNSW_EF,
+                num_threads=HNSW_NUM_THREADS,
+                rerank_candidates=RERANK_CANDIDATES,
+                deleted_ids=deleted_ids,
+                embeddings_sha256=embeddings_sha256,
+            )
+        else:
+            index = HNSWIndexManager.load_or_build(
+                self.embeddings_path,
+                self.index_path,
+                ef_construction=HNSW_EF_CONSTRUCTION,
+                M=HNSW_M,
+                ef=HNSW_EF,
+                num_threads=HNSW_NUM_THREADS,
+                deleted_ids=deleted_ids,
+                embeddings_sha256=embeddings_sha256,
+            )
+            if INDEX_ENGINE == "auto" and len(index) <= EXACT_SEARCH_MAX_ARTICLES:
+                exact = ExactSearchEngine(self.embeddings_path)
+                exact.mark_deleted(deleted_ids)
+                index, timings = fastest_engine(
+                    [index, exact], sample_queries(exact.vectors), k=4
+                )
+                logger.info("Selected the %s engine, timings: %s", index.name, timings)
+            return index
+        index.mark_deleted(deleted_ids)
+        return index
+
+    def warm_up(self):
+        # Runs a query through the whole pipeline, NLTK loading, the first
+        # encode and the first search included, so lazy initialization is paid
+        # before the bundle takes traffic. The caches are cleared after.
+        with timed(self.load_timings, "warm_up"):
+            self.find_similar_articles(WARMUP_QUERY, 1)
+            self.find_similar_articles_batch([WARMUP_QUERY, WARMUP_QUERY], 1)
+            self.invalidate_caches()
+        return self
+
+    def close(self):
+        self.encoder.close()
+
+    def invalidate_caches(self):
+        self.embedding_cache.clear()
+        self.result_cache.clear()
+
+    def encode_query(self, processed_query):
+        query_embedding = self.embedding_cache.get(processed_query)
+        if query_embedding is None:
+            query_embedding = self.encoder.encode(processed_query)
+            self.embedding_cache.put(processed_query, query_embedding)
+        return query_embedding
+
+    def encode_queries(self, processed_queries):
+        embeddings = {
+            query: self.embedding_cache.get(query) for query in processed_queries
+        }
+        missing = [
+            query for query, embedding in embeddings.items() if embedding is None
+        ]
+        if missing:
+            for query, embedding in zip(missing, self.encoder.encode_many(missing)):
+                self.embedding_cache.put(query, embedding)
+                embeddings[query] = embedding
+        return np.vstack([embeddings[query] for query in processed_queries])
+
+    def search(self, processed_query, k, labels=None, ef=None, admit=run_now):
+        labels = tuple(sorted(set(labels))) if labels else None
+        key = (processed_query, k, labels, ef)
+        result = self.result_cache.get(key)
+        if result is None:
+            # Identical queries arriving together share one encode and search,
+            # and only that one computation goes through admit.
+            result = self.in_flight.do(
+                key, lambda: admit(self._search, processed_query, k, labels, ef)
+            )
+        return result
+
+    def _search(self, processed_query, k, labels, ef):
+        with stage("encode"):
+            query_embedding = self.encode_query(processed_query)
+        with stage("search"):
+            if labels:
+                result = self.filtered_search.query(query_embedding, k, labels)
+            else:
+                result = self.index.query(query_embedding, k=k, ef=ef)
+        self.result_cache.put((processed_query, k, labels, ef), result)
+        return result
+
+    def search_batch(self, processed_queries, k, labels=None, ef=None):
+        # Unfiltered batches are answered by a single multi-threaded query;
+        # results are (ids, distances) pairs, one per query.
+        with stage("encode"):
+            query_embeddings = self.encode_queries(processed_queries)
+        with stage("search"):
+            if labels:
+                results = [
+                    self.filtered_search.query(query_embedding, k, labels)
+                    for query_embedding in query_embeddings
+                ]
+                return [(ids[0], distances[0]) for ids, distances in results]
+            ids, distances = self.index.query(query_embeddings, k=k, ef=ef)
+            return list(zip(ids, distances))
+
+    def unknown_labels(self, labels):
+        return [label for label in labels if label not in self.labels]
+
+    def find_similar_articles(
+        self, q_input, max_results, labels=None, ef=None, admit=run_now
+    ):
+        with stage("process_text"):
+            processed_query = process_text(q_input)
+        ids, distances = self.search(processed_query, max_results, labels, ef, admit)
+        with stage("build_response"):
+            return self.best_fits(*self.live_results(ids[0], distances[0]))
+
+    def find_similar_articles_page(
+        self, q_input, page_size, labels=None, ef=None, admit=run_now
+    ):
+        with stage("process_text"):
+            processed_query = process_text(q_input)
+        return self.similar_articles_page(
+            Cursor(processed_query, labels, ef), page_size, admit
+        )
+
+    def similar_articles_page(self, cursor, page_size, admit=run_now):
+        """
+        Returns the next page_size live articles of the cursor's candidate
+        list, from its offset on, and the cursor of the page after, or None
+        on the last page. The list is cached under the cursor's token; a
+        cursor whose list is not cached in this process is searched again.
+        """
+        ids, distances, complete = self._page_candidates(
+            cursor, cursor.offset + page_size, admit
+        )
+        page = []
+        position = cursor.offset
+        while len(page) < page_size:
+            if position >= len(ids):
+                if complete:
+                    break
+                ids, distances, complete = self._page_candidates(
+                    cursor, position + 1, admit
+                )
+                continue
+            if self.article_store.is_live(int(ids[position])):
+                page.append(position)
+            position += 1
+
+        # A page that did not advance has no page after it, so following the
+        # cursors always terminates.
+        more = position > cursor.offset and (position < len(ids) or not complete)
+        next_cursor = cursor.at(position) if more else None
+        with stage("build_response"):
+            return self.best_fits(ids[page], distances[page]), next_cursor
+
+    def _page_candidates(self, cursor, needed, admit):
+        # A list starts as long as the first page, so the first page is the
+        # same search, with the same ef, as an unpaginated request. It widens,
+        # doubling up to PAGE_CANDIDATES, when a page reads past its end;
+        # positions already served keep their articles.
+        cached = self.cursors.get(cursor.token)
+        if cached is not None and (len(cached[0]) >= needed or cached[2]):
+            return cached
+
+        limit = min(PAGE_CANDIDATES, len(self.index))
+        served = cached[0] if cached is not None else np.empty(0, np.uint64)
+        k = min(max(needed, 2 * len(served)), limit)
+        ids, distances = self.search(cursor.query, k, cursor.labels, cursor.ef, admit)
+        found = (ids[0] >= 0) & np.isfinite(distances[0])
+        ids, distances = ids[0][found], distances[0][found]
+        if cached is not None:
+            new = ~np.isin(ids, served)
+            ids = np.concatenate([served, ids[new]])
+            distances = np.concatenate([cached[1], distances[new]])
+        complete = k >= limit or found.sum() < k or len(ids) == len(served)
+        candidates = (ids, distances, complete)
+        self.cursors.put(cursor.token, candidates)
+        return candidates
+
+    def find_similar_articles_batch(
+        self, q_inputs, max_results, labels=None, ef=None, admit=run_now
+    ):
+        with stage("process_text"):
+            processed_queries = [process_text(q_input) for q_input in q_inputs]
+        results = admit(self.search_batch, processed_queries, max_results, labels, ef)
+        with stage("build_response"):
+            return [
+                self.best_fits(*self.live_results(ids, distances))
+                for ids, distances in results
+            ]
+
+    def find_articles_like(self, article_id, max_results):
+        # Answered from the precomputed neighbor table, skipping deleted
+        # neighbors, without encoding or searching.
+        ids, distances = self.neighbors.neighbors(article_id)
+        live = [self.article_store.is_live(int(i)) for i in ids]
+        with stage("build_response"):
+            return self.best_fits(
+                ids[live][:max_results], distances[live][:max_results]
+            )
+
+    def live_results(self, ids, distances):
+        # Engines pad a row with inf distances, and may return deleted ids,
+        # when fewer than k live articles match.
+        live = [
+            np.isfinite(dist) and self.article_store.is_live(int(i))
+            for i, dist in zip(ids, distances)
+        ]
+        return ids[live], distances[live]
+
+    def best_fits(self, ids, distances):
+        best_fits = []
+        articles = self.article_store.get_many(ids)
+        for i, dist, article in zip(ids, distances, articles):
+            best_fits.append(
+                {
+                    "id": int(i),
+                    "title": article["Title"],
+                    "label": article["Label"],
+                    "text": article["Text"],
+                    "url": article["URL"],
+                    "distance": float(dist),
+                }
+            )
+
+        return best_fits
+
+    def add_articles(self, records):
+        ids = add_articles(
+            records,
+            self.model,
+            self.article_store,
+            self.index,
+            self.embeddings_path,
+            self.index_path,
+            INGEST_BATCH_SIZE,
+            self.neighbors,
+        )
+        self._apply_store_changes()
+        return ids
+
+    def delete_articles(self, ids):
+        try:
+            delete_articles(
+                ids,
+                self.article_store,
+                self.index,
+                self.embeddings_path,
+                self.index_path,
+                self.neighbors,
+            )
+        finally:
+            # Articles caught up with before an unknown id was found count too.
+            self._apply_store_changes()
+
+    def sync(self):
+        """
+        Picks up articles that other processes, e.g. the other workers of a
+        gunicorn server, added or deleted. Called on every request; when the
+        store's files have not changed it costs two stats.
+        """
+        version = self.article_store.version()
+        if version == self.store_version:
+            return
+        self.store_version = version
+        with write_lock:
+            catch_up(
+                self.article_store, self.index, self.embeddings_path, self.neighbors
+            )
+        self._apply_store_changes()
+
+    def _apply_store_changes(self):
+        # Brings the label index up to date with the rows added and deleted
+        # since the last call, and drops cached results that may hold deleted
+        # articles or miss new ones. Cursors skip deleted articles when read.
+        with self._sync_lock:
+            store = self.article_store
+            rows, deleted = len(store), store.deleted[: len(store)]
+            added = np.arange(self._synced_rows, rows)
+            known = np.zeros(rows, dtype=bool)
+            known[: self._synced_rows] = self._synced_deleted[: self._synced_rows]
+            removed = np.flatnonzero(deleted & ~known)
+            if len(added):
+                self.filtered_search.add(
+                    added, [store.value("Label", int(i)) for i in added]
+                )
+            if len(removed):
+                self.filtered_search.remove(
+                    removed, [store.value("Label", int(i)) for i in removed]
+                )
+            if len(added) or len(removed):
+                self.result_cache.clear()
+            self._synced_rows, self._synced_deleted = rows, deleted
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "model": self.model_name,
+            "articles": len(self.article_store),
+            "engine": self.index.name,
+            "labels": self.labels.counts(),
+            "loaded_at": self.loaded_at,
+            "metadata": self.metadata,
+        }
+
+
+class BundleManager:
+    """
+    Holds the active bundle and swaps in new ones. A new bundle is loaded and
+    warmed up on a background thread while the active one keeps serving.
+    Requests read `active` once and use that bundle to the end, so in-flight
+    requests finish on the old bundle after a swap. Reloads requested through
+    request_reload are recorded in control_path, where the managers of the
+    other worker processes pick them up in follow_reloads.
+    """
+
+    def __init__(self, bundle, control_path=RELOAD_CONTROL_PATH):
+        self.active = bundle
+        self.reload_status = {"state": "idle"}
+        self.startup = None
+        self.control_path = control_path
+        self._reload_lock = threading.Lock()
+        self._follow_lock = threading.Lock()
+        # Reloads recorded before the server started are not followed.
+        self._control_mtime, request = self._read_control()
+        self._followed = request and request["id"]
+
+    @classmethod
+    def start(cls, bundle, background=False):
+        """
+        Loads and warms up the first bundle, on a background thread when
+        background is True, in which case `active` is None until it is ready.
+        The startup report records the time spent in each phase, "imports"
+        being the time from process start to the beginning of the load.
+        """
+        manager = cls(None)
+        if background:
+            manager.reload_status = {"state": "loading", "bundle": None}
+            threading.Thread(
+                target=manager._start, args=(bundle,), name="bundle-load", daemon=True
+            ).start()
+        else:
+            manager._start(bundle, raise_errors=True)
+        return manager
+
+    def _start(self, bundle, raise_errors=False):
+        try:
+            started_at = time.time()
+            bundle.load().warm_up()
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.exception("Failed to load bundle %s", bundle.version)
+            self.reload_status = {"state": "failed", "bundle": None, "error": str(e)}
+            return
+
+        ready_at = time.time()
+        self.startup = {
+            "phases": dict(
+                imports=started_at - process_started_at(), **bundle.load_timings
+            ),
+            "seconds_to_ready": ready_at - process_started_at(),
+            "ready_at": ready_at,
+        }
+        self.active = bundle
+        self.reload_status = {"state": "idle", "bundle": None}
+        logger.info(
+            "Ready in %.1fs: %s",
+            self.startup["seconds_to_ready"],
+            ", ".join(
+                f"{phase} {seconds:.2f}s"
+                for phase, seconds in self.startup["phases"].items()
+            ),
+        )
+
+    @property
+    def ready(self):
+        return self.active is not None
+
+    def reload(self, bundle_dir=None):
+        """
+        Starts loading a bundle in the background, or reloads the active
+        bundle's files when no directory is given. Returns False if a reload
+        is already running.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        self.reload_status = {"state": "loading", "bundle": bundle_dir}
+        threading.Thread(
+            target=self._reload, args=(bundle_dir,), name="bundle-reload", daemon=True
+        ).start()
+        return True
+
+    def request_reload(self, bundle_dir=None):
+        """
+        Starts a reload like reload, and records it in the control file, so
+        the other worker processes of the server follow it. Returns False if
+        a reload is already running in this process. A control file that
+        cannot be written is logged; the reload goes on in this process.
+        """
+        if not self.reload(bundle_dir):
+            return False
+        if self.control_path:
+            request = {"id": uuid.uuid4().hex, "bundle": bundle_dir}
+            self._followed = request["id"]
+            tmp_path = f"{self.control_path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(self.control_path) or ".", exist_ok=True)
+                with open(tmp_path, "w") as f:
+                    json.dump(request, f)
+                os.replace(tmp_path, self.control_path)
+            except OSError:
+                logger.exception(
+                    "Failed to record the reload in %s, the other workers "
+                    "will not follow it",
+                    self.control_path,
+                )
+        return True
+
+    def follow_reloads(self):
+        """
+        Starts the reload last recorded in the control file by another worker
+        process, unless this one already followed it. Costs a stat while the
+        file is unchanged; a reload that cannot start yet, because another is
+        running, is followed on a later call.
+        """
+        if not self.control_path or not self._follow_lock.acquire(blocking=False):
+            return
+        try:
+            try:
+                if os.stat(self.control_path).st_mtime_ns == self._control_mtime:
+                    return
+            except FileNotFoundError:
+                return
+            mtime, request = self._read_control()
+            if request is not None and request["id"] != self._followed:
+                bundle_dir = request["bundle"]
+                try:
+                    if bundle_dir:
+                        bundle_dir = resolve_bundle_dir(bundle_dir)
+                except ValueError as e:
+                    logger.error("Not following the reload of %s: %s", bundle_dir, e)
+                else:
+                    if not self.reload(bundle_dir):
+                        return
+                    logger.info("Following the reload of bundle %s", bundle_dir)
+            self._control_mtime = mtime
+            self._followed = request and request["id"]
+        finally:
+            self._follow_lock.release()
+
+    def _read_control(self):
+        # The control file's mtime and the reload it records, or None for both
+        # when there is no file.
+        if not self.control_path:
+            return None, None
+        try:
+            with open(self.control_path) as f:
+                return os.fstat(f.fileno()).st_mtime_ns, json.load(f)
+        except FileNotFoundError:
+            return None, None
+
+    def _reload(self, bundle_dir):
+        try:
+            if bundle_dir:
+                bundle = ServingBundle.from_path(bundle_dir, confined=True)
+            else:
+                active = self.active
+                bundle = ServingBundle(
+                    active.version,
+                    active.model_name,
+                    active.embeddings_path,
+                    active.index_path,
+                    active.articles_dir,
+                    data_path=active.data_path,
+                    metadata=active.metadata,
+                )
+            bundle.load().warm_up()
+
+            previous, self.active = self.active, bundle
+            previous.close()
+            self.reload_status = {"state": "idle", "bundle": bundle_dir}
+            logger.info("Switched to bundle %s", bundle.version)
+        except Exception as e:
+            logger.exception("Failed to load bundle %s", bundle_dir)
+            self.reload_status = {
+                "state": "failed",
+                "bundle": bundle_dir,
+                "error": str(e),
+            }
+        finally:
+            self._reload_lock.release()
@@ -0,0 +1,162 @@
+import os
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+DATA_PATH = os.environ.get(
+    "SYNAPTIC_DATA_PATH", os.path.join(base_dir, "data", "data.xlsx")
+)
+ARTICLES_DIR = os.environ.get(
+    "SYNAPTIC_ARTICLES_DIR", os.path.join(base_dir, "data", "articles")
+)
+EMBEDDINGS_PATH = os.environ.get(
+    "SYNAPTIC_EMBEDDINGS_PATH", os.path.join(base_dir, "embeddings", "embeddings.npy")
+)
+INDEX_PATH = os.environ.get(
+    "SYNAPTIC_INDEX_PATH", os.path.join(base_dir, "embeddings", "embeddings.hnsw")
+)
+PLOTS_DIR = os.path.join(base_dir, "plots")
+
+MODEL_NAME = os.environ.get("SYNAPTIC_MODEL_NAME", "multi-qa-mpnet-base-dot-v1")
+
+# Query encoder backend: "torch", "torch-int8", "onnx" or "stub" (see
+# encoders.py). ENCODER_THREADS of 0 keeps the backend's default thread count.
+ENCODER_BACKEND = os.environ.get("SYNAPTIC_ENCODER_BACKEND", "torch")
+ENCODER_THREADS = int(os.environ.get("SYNAPTIC_ENCODER_THREADS", 0))
+ONNX_DIR = os.environ.get(
+    "SYNAPTIC_ONNX_DIR", os.path.join(base_dir, "embeddings", "onnx")
+)
+# Embedding size of the "stub" backend; it must match the corpus it serves.
+STUB_ENCODER_DIM = int(os.environ.get("SYNAPTIC_STUB_ENCODER_DIM", 768))
+
+# Search engine: "exact" for brute-force NumPy search, "hnsw", "quantized" to
+# keep only int8/float16 codes resident and re-rank the best candidates with
+# exact float32 scores, "ivfpq" for an inverted-file index with product-quantized
+# codes for corpora that do not fit in memory, "projected" for HNSW over
+# embeddings projected to PROJECTION_DIM principal directions with the best
+# candidates re-scored at full dimension, or "auto" to benchmark exact and
+# HNSW search at startup and keep the faster one. Corpora above
+# EXACT_SEARCH_MAX_ARTICLES always use HNSW in auto mode.
+INDEX_ENGINE = os.environ.get("SYNAPTIC_INDEX_ENGINE", "auto")
+EXACT_SEARCH_MAX_ARTICLES = int(
+    os.environ.get("SYNAPTIC_EXACT_SEARCH_MAX_ARTICLES", 50000)
+)
+QUANTIZATION = os.environ.get("SYNAPTIC_QUANTIZATION", "int8")
+
+# HNSW graph parameters. M and ef_construction are part of the index
+# fingerprint, so changing them rebuilds the index; ef is the default search
+# breadth. benchmarks/bench_hnsw_params.py measures their trade-offs.
+HNSW_M = int(os.environ.get("SYNAPTIC_HNSW_M", 16))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("SYNAPTIC_HNSW_EF_CONSTRUCTION", 200))
+HNSW_EF = int(os.environ.get("SYNAPTIC_HNSW_EF", 50))
+# Threads hnswlib uses to build the index and answer batched queries; -1 uses
+# every core. Lower it when several server workers share the machine.
+HNSW_NUM_THREADS = int(os.environ.get("SYNAPTIC_HNSW_NUM_THREADS", -1))
+# Search breadth (HNSW ef) for each value of the "accuracy" request parameter.
+ACCURACY_TIERS = {
+    "fast": int(os.environ.get("SYNAPTIC_HNSW_EF_FAST", 16)),
+    "balanced": HNSW_EF,
+    "accurate": int(os.environ.get("SYNAPTIC_HNSW_EF_ACCURATE", 200)),
+}
+
+IVF_NLIST = int(os.environ.get("SYNAPTIC_IVF_NLIST", 1024))
+IVF_NPROBE = int(os.environ.get("SYNAPTIC_IVF_NPROBE", 16))
+PQ_M = int(os.environ.get("SYNAPTIC_PQ_M", 48))
+# Dimensions the "projected" engine indexes; benchmarks/bench_projection.py
+# measures recall and latency for each.
+PROJECTION_DIM = int(os.environ.get("SYNAPTIC_PROJECTION_DIM", 256))
+# Candidates re-scored with exact float32 scores by the quantized, IVF-PQ and
+# projected engines; 0 turns re-ranking off for IVF-PQ.
+RERANK_CANDIDATES = int(os.environ.get("SYNAPTIC_RERANK_CANDIDATES", 64))
+
+# Nearest neighbors precomputed per article for GET /articles/<id>/similar.
+# More than the largest maxResults are kept, so deleted neighbors can be
+# skipped.
+NEIGHBOR_COUNT = int(os.environ.get("SYNAPTIC_NEIGHBOR_COUNT", 16))
+
+# Label-filtered searches matching at most this many articles score exactly
+# those articles; broader filters are pushed down to the search engine.
+FILTER_EXACT_MAX_ARTICLES = int(
+    os.environ.get("SYNAPTIC_FILTER_EXACT_MAX_ARTICLES", 10000)
+)
+# Budget for the normalized vectors of those small labels, kept between
+# queries; the least recently used labels are dropped first.
+FILTER_BLOCK_CACHE_BYTES = int(
+    os.environ.get("SYNAPTIC_FILTER_BLOCK_CACHE_BYTES", 256 << 20)
+)
+
+# Query encoding micro-batching: queries that arrive within the wait window are
+# encoded together, up to the maximum batch size.
+ENCODE_BATCH_WAIT_MS = float(os.environ.get("SYNAPTIC_ENCODE_BATCH_WAIT_MS", 5))
+ENCODE_MAX_BATCH_SIZE = int(os.environ.get("SYNAPTIC_ENCODE_MAX_BATCH_SIZE", 32))
+
+# Query caches, keyed on the normalized query. A size of 0 disables a cache and
+# a TTL of 0 keeps entries until they are evicted.
+QUERY_CACHE_SIZE = int(os.environ.get("SYNAPTIC_QUERY_CACHE_SIZE", 4096))
+QUERY_CACHE_TTL_SECONDS = float(os.environ.get("SYNAPTIC_QUERY_CACHE_TTL_SECONDS", 0))
+RESULT_CACHE_SIZE = int(os.environ.get("SYNAPTIC_RESULT_CACHE_SIZE", 4096))
+
+# Admission control for the search endpoints, per server process: at most
+# ADMISSION_MAX_CONCURRENT searches run at once and ADMISSION_MAX_QUEUE wait.
+# Searches that find the queue full, or cannot start within
+# REQUEST_DEADLINE_MS, are answered with 503 right away.
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("SYNAPTIC_ADMISSION_MAX_CONCURRENT", 4))
+ADMISSION_MAX_QUEUE = int(os.environ.get("SYNAPTIC_ADMISSION_MAX_QUEUE", 32))
+REQUEST_DEADLINE_MS = float(os.environ.get("SYNAPTIC_REQUEST_DEADLINE_MS", 1000))
+
+# Single-query searches fetch the results of the first page and cache them for
+# CURSOR_TTL_SECONDS under the cursor returned in the X-Next-Cursor header. A
+# page that reads past the cached results searches again for twice as many, up
+# to PAGE_CANDIDATES results per query in all.
+PAGE_CANDIDATES = int(os.environ.get("SYNAPTIC_PAGE_CANDIDATES", 64))
+CURSOR_CACHE_SIZE = int(os.environ.get("SYNAPTIC_CURSOR_CACHE_SIZE", 10000))
+CURSOR_TTL_SECONDS = float(os.environ.get("SYNAPTIC_CURSOR_TTL_SECONDS", 600))
+
+# Longest excerpt returned by the "snippet" parameter, in characters, and the
+# smallest JSON response compressed for clients that accept gzip or brotli.
+SNIPPET_MAX_CHARS = int(os.environ.get("SYNAPTIC_SNIPPET_MAX_CHARS", 2000))
+COMPRESSION_MIN_BYTES = int(os.environ.get("SYNAPTIC_COMPRESSION_MIN_BYTES", 1024))
+
+# Adds a Server-Timing header with the time spent in each pipeline stage to
+# every response. Stage histograms are exported on /metrics either way.
+SERVER_TIMING = os.environ.get("SYNAPTIC_SERVER_TIMING", "0") == "1"
+
+# Largest number of queries accepted by the batch search endpoint.
+MAX_BATCH_QUERIES = int(os.environ.get("SYNAPTIC_MAX_BATCH_QUERIES", 64))
+
+# Size of the thread pool the ASGI app runs query encoding and kNN search on.
+ASGI_COMPUTE_WORKERS = int(os.environ.get("SYNAPTIC_ASGI_COMPUTE_WORKERS", 4))
+
+# Batch size used to encode articles added through ingestion.
+INGEST_BATCH_SIZE = int(os.environ.get("SYNAPTIC_INGEST_BATCH_SIZE", 64))
+
+# NLTK resources are looked up locally and only missing ones are downloaded;
+# with SYNAPTIC_NLTK_OFFLINE=1 a missing resource fails startup instead.
+NLTK_OFFLINE = os.environ.get("SYNAPTIC_NLTK_OFFLINE", "0") == "1"
+
+# Loads and warms up the serving bundle on a background thread, so the server
+# accepts connections right away and answers 503 until GET /ready reports the
+# bundle loaded. Only for single-process servers: with gunicorn's preload_app
+# the bundle must be loaded before the workers are forked.
+LOAD_IN_BACKGROUND = os.environ.get("SYNAPTIC_LOAD_IN_BACKGROUND", "0") == "1"
+
+# Serving bundle loaded at startup. When unset, the model, embeddings, index and
+# article store configured above are served as the "default" bundle.
+BUNDLE_PATH = os.environ.get("SYNAPTIC_BUNDLE_PATH")
+# Directory POST /admin/reload loads bundles from; bundle directories are given
+# relative to it and cannot leave it. When unset, only the active bundle can be
+# reloaded.
+BUNDLES_ROOT = os.environ.get("SYNAPTIC_BUNDLES_ROOT")
+# File reloads are recorded in, so every worker process of the server follows a
+# reload on its next request; empty keeps reloads to the worker that received
+# them. Each worker loads a reloaded bundle on its own, so unlike the bundle
+# preloaded before the fork, its model and index are not shared between them.
+RELOAD_CONTROL_PATH = os.environ.get(
+    "SYNAPTIC_RELOAD_CONTROL_PATH", os.path.join(base_dir, "data", "reload.json")
+)
+
+# Token the /admin/* endpoints require as "Authorization: Bearer <token>". When
+# unset, they are disabled. They are never open to cross-origin browser calls.
+ADMIN_TOKEN = os.environ.get("SYNAPTIC_ADMIN_TOKEN")
+# Origins allowed to call the search endpoints from a browser, comma-separated.
+CORS_ORIGINS = os.environ.get("SYNAPTIC_CORS_ORIGINS", "*").split(",")
+WARMUP_QUERY = os.environ.get("SYNAPTIC_WARMUP_QUERY", "introduction to physics")
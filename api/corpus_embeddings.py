@@ -0,0 +1,228 @@
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from article_store import ArticleStore
+from hnsw_manager import file_fingerprint
+from utils import get_text_normalizer
+
+logger = logging.getLogger(__name__)
+
+
+def default_manifest_path(embeddings_path):
+    return os.path.splitext(embeddings_path)[0] + ".manifest.json"
+
+
+def _write_json(path, content):
+    with open(path + ".tmp", "w") as f:
+        json.dump(content, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def build_manifest(model_name, store, embeddings_path, embeddings_sha256=None):
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    return {
+        "model": model_name,
+        "rows": len(embeddings),
+        "dim": embeddings.shape[1],
+        "articles_sha256": store.fingerprint("Text"),
+        "embeddings_sha256": embeddings_sha256 or file_fingerprint(embeddings_path),
+    }
+
+
+def load_manifest(embeddings_path):
+    path = default_manifest_path(embeddings_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def update_manifest(embeddings_path, store, embeddings_sha256=None):
+    # Called after articles are appended, so the manifest keeps describing
+    # the embeddings file. Files built without a manifest are left alone.
+    manifest = load_manifest(embeddings_path)
+    if manifest is not None:
+        _write_json(
+            default_manifest_path(embeddings_path),
+            build_manifest(
+                manifest["model"], store, embeddings_path, embeddings_sha256
+            ),
+        )
+
+
+def _same_model(a, b):
+    if os.path.exists(a) and os.path.exists(b):
+        return os.path.realpath(a) == os.path.realpath(b)
+    return a == b
+
+
+def verify_manifest(embeddings_path, model_name, store, embeddings_sha256=None):
+    """
+    Checks that embeddings.npy was built with model_name from the articles in
+    store, row for row, and has not changed since. Raises ValueError listing
+    the mismatches; files without a manifest are only logged. The file is
+    hashed unless its embeddings_sha256 is given.
+    """
+    manifest = load_manifest(embeddings_path)
+    if manifest is None:
+        logger.warning(
+            "%s has no manifest, its rows cannot be checked against the articles",
+            embeddings_path,
+        )
+        return
+
+    expected = build_manifest(
+        manifest["model"], store, embeddings_path, embeddings_sha256
+    )
+    mismatches = [
+        f"{key} is {expected[key]}, the manifest has {manifest[key]}"
+        for key in ("rows", "dim", "articles_sha256", "embeddings_sha256")
+        if manifest[key] != expected[key]
+    ]
+    if len(store) != expected["rows"]:
+        mismatches.append(f"the article store has {len(store)} rows")
+    if not _same_model(manifest["model"], model_name):
+        mismatches.append(
+            f"the embeddings were built with {manifest['model']}, not {model_name}"
+        )
+    if mismatches:
+        raise ValueError(
+            f"{embeddings_path} does not match the serving corpus: "
+            f"{'; '.join(mismatches)}. Rebuild it with corpus_embeddings.py."
+        )
+
+
+class EmbeddingsBuilder:
+    """
+    Encodes every article of a store into an embeddings file whose row i is
+    the embedding of article i. Articles are processed in chunks ordered by
+    text length, so each encode batch holds texts of similar length and pads
+    little. Rows are written into a preallocated memory-mapped .npy next to
+    the target, and a checkpoint recording how many articles are done is
+    saved after every chunk, so an interrupted build resumes from there. The
+    finished file replaces the target and a manifest with the model, row
+    count and content hashes is written last.
+    """
+
+    def __init__(self, model, model_name, store, embeddings_path):
+        self.model = model
+        self.model_name = model_name
+        self.store = store
+        self.embeddings_path = embeddings_path
+        self.partial_path = embeddings_path + ".partial"
+        self.checkpoint_path = embeddings_path + ".checkpoint.json"
+
+    def build_fingerprint(self):
+        return {
+            "model": self.model_name,
+            "rows": len(self.store),
+            "dim": self.model.get_sentence_embedding_dimension(),
+            "articles_sha256": self.store.fingerprint("Text"),
+        }
+
+    def order(self):
+        # The offsets give every text's length without reading the texts.
+        offsets = np.load(
+            os.path.join(self.store.store_dir, "Text.offsets.npy"), mmap_mode="r"
+        )
+        return np.argsort(np.diff(offsets[: len(self.store) + 1]), kind="stable")
+
+    def _open(self, fingerprint):
+        # Resumes from the checkpoint when it was written for the same build.
+        if os.path.exists(self.checkpoint_path) and os.path.exists(self.partial_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint["fingerprint"] == fingerprint:
+                logger.info(
+                    "Resuming from article %d/%d",
+                    checkpoint["done"],
+                    fingerprint["rows"],
+                )
+                embeddings = np.lib.format.open_memmap(self.partial_path, mode="r+")
+                return embeddings, checkpoint["done"]
+            logger.info("Ignoring a checkpoint of a different build")
+
+        embeddings = np.lib.format.open_memmap(
+            self.partial_path,
+            mode="w+",
+            dtype=np.float32,
+            shape=(fingerprint["rows"], fingerprint["dim"]),
+        )
+        return embeddings, 0
+
+    def build(self, chunk_size=8192, batch_size=128):
+        fingerprint = self.build_fingerprint()
+        embeddings, done = self._open(fingerprint)
+        order = self.order()
+        normalizer = get_text_normalizer()
+        start_time = time.perf_counter()
+
+        for start in range(done, len(order), chunk_size):
+            ids = np.sort(order[start : start + chunk_size])
+            texts = normalizer.normalize_batch(
+                [self.store.value("Text", int(i)) for i in ids]
+            )
+            # Within the chunk, texts are encoded longest first, like
+            # sentence-transformers does, so the first batch hits peak memory.
+            by_length = np.argsort([-len(text) for text in texts], kind="stable")
+            encoded = self.model.encode(
+                [texts[i] for i in by_length], batch_size=batch_size
+            )
+            embeddings[ids[by_length]] = np.asarray(encoded, dtype=np.float32)
+            embeddings.flush()
+
+            done = start + len(ids)
+            _write_json(
+                self.checkpoint_path, {"fingerprint": fingerprint, "done": done}
+            )
+            logger.info(
+                "Encoded %d/%d articles in %.1fs",
+                done,
+                len(order),
+                time.perf_counter() - start_time,
+            )
+
+        del embeddings
+        os.replace(self.partial_path, self.embeddings_path)
+        _write_json(
+            default_manifest_path(self.embeddings_path),
+            build_manifest(self.model_name, self.store, self.embeddings_path),
+        )
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        return self.embeddings_path
+
+
+if __name__ == "__main__":
+    from config import ARTICLES_DIR, DATA_PATH, EMBEDDINGS_PATH, MODEL_NAME
+
+    parser = argparse.ArgumentParser(
+        description="Encode every article of the store into the embeddings file."
+    )
+    parser.add_argument("--articles-dir", type=str, default=ARTICLES_DIR)
+    parser.add_argument("--data-path", type=str, default=DATA_PATH)
+    parser.add_argument("--embeddings-path", type=str, default=EMBEDDINGS_PATH)
+    parser.add_argument("--model", type=str, default=MODEL_NAME)
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=8192,
+        help="Articles encoded between two checkpoints.",
+    )
+    parser.add_argument("--batch-size", type=int, default=128)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    from sentence_transformers import SentenceTransformer
+
+    store = ArticleStore.open_or_convert(args.articles_dir, args.data_path)
+    builder = EmbeddingsBuilder(
+        SentenceTransformer(args.model), args.model, store, args.embeddings_path
+    )
+    builder.build(args.chunk_size, args.batch_size)
+    print(f"Wrote {len(store)} embeddings to {args.embeddings_path}")
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from utils import seed_torch
+
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+
+def load_encoder(model_name, backend="torch", num_threads=0, onnx_dir=None):
+    """
+    Returns an object with a SentenceTransformer-compatible
+    encode(sentences, batch_size) method for the chosen backend:
+
+    - "torch": the stock SentenceTransformer, on GPU when available.
+    - "torch-int8": the SentenceTransformer with its Linear layers dynamically
+      quantized to int8, for CPU inference.
+    - "onnx": the transformer exported to ONNX and run with ONNX Runtime, with
+      the pooling and normalization of the original model applied in NumPy.
+    - "stub": a deterministic StubEncoder that ignores model_name, for
+      benchmarks and offline runs against synthetic corpora.
+
+    num_threads sets the intra-op threads of the backend; 0 keeps the default.
+    """
+    if backend == "stub":
+        from config import STUB_ENCODER_DIM
+
+        return StubEncoder(STUB_ENCODER_DIM)
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown encoder backend {backend!r}, use one of {BACKENDS + ('stub',)}."
+        )
+    if backend == "onnx":
+        return OnnxEncoder.load_or_export(model_name, onnx_dir, num_threads)
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    seed_torch()
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    model = SentenceTransformer(model_name)
+    if backend == "torch-int8":
+        return torch.quantization.quantize_dynamic(
+            model.to("cpu"), {torch.nn.Linear}, dtype=torch.qint8
+        )
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    return model.to(device)
+
+
+class StubEncoder:
+    """
+    Stand-in for a model that maps each text to a unit vector drawn from a
+    generator seeded with a hash of the text, so equal texts always get equal
+    embeddings. It encodes in microseconds and needs no model files, so a
+    benchmark with it measures everything in the service but the model.
+    """
+
+    def __init__(self, dim=768):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        embeddings = np.empty((len(sentences), self.dim), dtype=np.float32)
+        for row, sentence in enumerate(sentences):
+            digest = hashlib.blake2b(sentence.encode("utf-8"), digest_size=8).digest()
+            rng = np.random.default_rng(int.from_bytes(digest, "little"))
+            embeddings[row] = rng.standard_normal(self.dim, dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+
+class OnnxEncoder:
+    def __init__(self, export_dir, num_threads=0):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(export_dir, "encoder.json")) as f:
+            self.config = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(export_dir, "model.onnx"),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = [
+            model_input.name for model_input in self.session.get_inputs()
+        ]
+
+    @classmethod
+    def load_or_export(cls, model_name, onnx_dir, num_threads=0):
+        export_dir = os.path.join(onnx_dir, re.sub(r"[^\w.-]", "_", model_name))
+        if not os.path.exists(os.path.join(export_dir, "encoder.json")):
+            cls.export(model_name, export_dir)
+        return cls(export_dir, num_threads)
+
+    @staticmethod
+    def export(model_name, export_dir):
+        import torch
+        from sentence_transformers import SentenceTransformer, models
+
+        model = SentenceTransformer(model_name, device="cpu")
+        transformer, pooling = model[0], model[1]
+        tokenizer = transformer.tokenizer
+        os.makedirs(export_dir, exist_ok=True)
+
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        input_names = [
+            name
+            for name in ("input_ids", "attention_mask", "token_type_ids")
+            if name in sample
+        ]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        class HiddenStates(torch.nn.Module):
+            def __init__(self, auto_model):
+                super().__init__()
+                self.auto_model = auto_model
+
+            def forward(self, *inputs):
+                outputs = self.auto_model(**dict(zip(input_names, inputs)))
+                return outputs[0]
+
+        torch.onnx.export(
+            HiddenStates(transformer.auto_model).eval(),
+            tuple(sample[name] for name in input_names),
+            os.path.join(export_dir, "model.onnx"),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+        tokenizer.save_pretrained(export_dir)
+
+        if hasattr(pooling, "get_pooling_mode_str"):
+            pooling_mode = pooling.get_pooling_mode_str()
+        else:
+            pooling_mode = pooling.pooling_mode
+        if pooling_mode not in ("cls", "mean", "max"):
+            raise ValueError(f"Pooling mode {pooling_mode!r} is not supported.")
+
+        config = {
+            "model_name": model_name,
+            "max_seq_length": model.max_seq_length,
+            "pooling": pooling_mode,
+            "normalize": any(isinstance(module, models.Normalize) for module in model),
+        }
+        with open(os.path.join(export_dir, "encoder.json"), "w") as f:
+            json.dump(config, f, indent=2)
+
+    def _pool(self, hidden_states, attention_mask):
+        if self.config["pooling"] == "cls":
+            return hidden_states[:, 0]
+        mask = attention_mask[..., None].astype(hidden_states.dtype)
+        if self.config["pooling"] == "max":
+            return np.where(mask > 0, hidden_states, -1e9).max(axis=1)
+        return (hidden_states * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        # Sorting by length keeps the padding inside each batch small.
+        order = np.argsort([-len(sentence) for sentence in sentences], kind="stable")
+        embeddings = [None] * len(sentences)
+        for start in range(0, len(sentences), batch_size):
+            batch_ids = order[start : start + batch_size]
+            inputs = self.tokenizer(
+                [sentences[i] for i in batch_ids],
+                padding=True,
+                truncation=True,
+                max_length=self.config["max_seq_length"],
+                return_tensors="np",
+            )
+            feed = {name: inputs[name].astype(np.int64) for name in self.input_names}
+            hidden_states = self.session.run(None, feed)[0]
+            pooled = self._pool(hidden_states, inputs["attention_mask"])
+            if self.config["normalize"]:
+                pooled /= np.maximum(
+                    np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12
+                )
+            for i, embedding in zip(batch_ids, pooled):
+                embeddings[i] = embedding
+        return np.stack(embeddings).astype(np.float32)
@@ -0,0 +1,105 @@
+import numpy as np
+
+from quantized_index import normalize_rows
+from search_engine import SearchEngine
+
+
+def top_k(scores, k):
+    # Best k columns of every row of a similarity matrix, as (ids, distances).
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    ids = np.take_along_axis(top, order, axis=1)
+    distances = 1 - np.take_along_axis(top_scores, order, axis=1)
+    return ids, distances.astype(np.float32)
+
+
+def query_subset(vectors, ids, query_embedding, k):
+    """
+    Exact search among the given sorted ids only, reading just their rows of
+    the memory-mapped embeddings, so the cost grows with the subset size.
+    """
+    queries = normalize_rows(np.atleast_2d(query_embedding))
+    scores = queries @ normalize_rows(vectors[ids]).T
+    if not len(ids):
+        return np.empty((len(queries), 0), np.uint64), scores
+    found, distances = top_k(scores, k)
+    return ids[found].astype(np.uint64), distances
+
+
+class ExactSearchEngine(SearchEngine):
+    """
+    Brute-force cosine search: one BLAS matrix product per block of corpus rows
+    and an argpartition for the top k. Results are exact. The vectors are read
+    from the memory-mapped embeddings file and only their norms are kept in
+    memory, unless in_memory is set.
+    """
+
+    name = "exact"
+
+    def __init__(self, embeddings_path, in_memory=False, block_size=65536):
+        self.embeddings_path = embeddings_path
+        self.in_memory = in_memory
+        self.block_size = block_size
+        self.vectors = self._open_vectors()
+        self.dim = self.vectors.shape[1]
+        self.norms = self._norms(self.vectors)
+        self.deleted = np.zeros(len(self.vectors), dtype=bool)
+
+    def _open_vectors(self):
+        if self.in_memory:
+            return np.load(self.embeddings_path).astype(np.float32, copy=False)
+        return np.load(self.embeddings_path, mmap_mode="r")
+
+    def _norms(self, vectors):
+        norms = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), self.block_size):
+            block = np.asarray(vectors[start : start + self.block_size], np.float32)
+            norms[start : start + len(block)] = np.linalg.norm(block, axis=1)
+        return np.maximum(norms, 1e-12)
+
+    def __len__(self):
+        return len(self.norms)
+
+    def add_items(self, embeddings, ids):
+        # The flags and vectors grow before the norms, and a query scores only
+        # as many rows as the norms it started with, so a concurrent query
+        # never reads a row without its norm.
+        self.deleted = np.concatenate(
+            [self.deleted, np.zeros(len(embeddings), dtype=bool)]
+        )
+        self.vectors = self._open_vectors()
+        self.norms = np.concatenate([self.norms, self._norms(embeddings)])
+
+    def mark_deleted(self, ids):
+        deleted = self.deleted.copy()
+        deleted[np.asarray(ids, dtype=np.int64)] = True
+        self.deleted = deleted
+
+    def scores(self, queries):
+        norms, vectors = self.norms, self.vectors
+        deleted = self.deleted[: len(norms)]
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        queries = queries / np.maximum(
+            np.linalg.norm(queries, axis=1, keepdims=True), 1e-12
+        )
+
+        scores = np.empty((len(queries), len(norms)), dtype=np.float32)
+        for start in range(0, len(norms), self.block_size):
+            end = min(start + self.block_size, len(norms))
+            block = np.asarray(vectors[start:end], np.float32)
+            scores[:, start:end] = (queries @ block.T) / norms[start:end]
+        scores[:, deleted] = -np.inf
+        return scores
+
+    def query(self, query_embedding, k, ef=None):
+        ids, distances = top_k(self.scores(query_embedding), k)
+        return ids.astype(np.uint64), distances
+
+    def query_filtered(self, query_embedding, k, allowed):
+        scores = self.scores(query_embedding)
+        scores[:, ~allowed[: scores.shape[1]]] = -np.inf
+        ids, distances = top_k(scores, k)
+        keep = np.isfinite(distances[0])
+        return ids[:, keep].astype(np.uint64), distances[:, keep]
@@ -0,0 +1,134 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from exact_engine import query_subset, top_k
+from quantized_index import normalize_rows
+
+
+class LabelIndex:
+    """
+    Sorted ids of the live articles under every label, built from the Label
+    column of the article store. Arrays are replaced rather than modified, so
+    a query running alongside an ingestion sees either the old or the new ids.
+    """
+
+    def __init__(self, labels, deleted):
+        labels = np.asarray(labels, dtype=object)
+        self.size = len(labels)
+        self._ids = {
+            label: np.flatnonzero((labels == label) & ~deleted)
+            for label in np.unique(labels)
+        }
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_store(cls, store):
+        return cls(store.column("Label"), store.deleted)
+
+    def __contains__(self, label):
+        return label in self._ids
+
+    def counts(self):
+        return {label: len(ids) for label, ids in self._ids.items()}
+
+    def ids_for(self, labels):
+        ids = [self._ids.get(label, np.empty(0, np.int64)) for label in labels]
+        return np.unique(np.concatenate(ids)) if len(ids) > 1 else ids[0]
+
+    def add(self, ids, labels):
+        with self._lock:
+            for label in set(labels):
+                new_ids = [i for i, other in zip(ids, labels) if other == label]
+                self._ids[label] = np.concatenate(
+                    [self._ids.get(label, np.empty(0, np.int64)), new_ids]
+                ).astype(np.int64)
+            self.size = max(self.size, max(ids) + 1)
+
+    def remove(self, ids, labels):
+        with self._lock:
+            for label in set(labels):
+                self._ids[label] = np.setdiff1d(self._ids[label], ids)
+
+
+class FilteredSearch:
+    """
+    kNN search restricted to articles with one of the given labels. The
+    strategy follows the filter's selectivity: when at most exact_max_articles
+    articles match, they are scored exactly against per-label sub-indexes,
+    normalized copies of each small label's vectors built on first use and
+    kept within block_cache_bytes, which costs about as much as an unfiltered
+    query. Broader filters are pushed
+    down to the engine's query_filtered, where HNSW skips rejected ids during
+    the graph walk.
+    """
+
+    def __init__(
+        self,
+        index,
+        embeddings_path,
+        labels,
+        exact_max_articles,
+        block_cache_bytes=256 << 20,
+    ):
+        self.index = index
+        self.embeddings_path = embeddings_path
+        self.labels = labels
+        self.exact_max_articles = exact_max_articles
+        self.block_cache_bytes = block_cache_bytes
+        self._blocks = OrderedDict()
+        self._block_bytes = 0
+        self._blocks_lock = threading.Lock()
+        self.vectors = np.load(embeddings_path, mmap_mode="r")
+
+    def add(self, ids, labels):
+        # embeddings.npy grew with the ingestion, so it is re-opened.
+        self.vectors = np.load(self.embeddings_path, mmap_mode="r")
+        self.labels.add(ids, labels)
+
+    def remove(self, ids, labels):
+        self.labels.remove(ids, labels)
+
+    def _block(self, label):
+        # A label's id array is replaced whenever it changes, so a block built
+        # from an older array is stale.
+        ids = self.labels.ids_for([label])
+        with self._blocks_lock:
+            block = self._blocks.get(label)
+            if block is not None and block[0] is ids:
+                self._blocks.move_to_end(label)
+                return block
+
+        block = ids, normalize_rows(self.vectors[ids])
+        with self._blocks_lock:
+            stale = self._blocks.pop(label, None)
+            if stale is not None:
+                self._block_bytes -= stale[1].nbytes
+            # Blocks larger than the whole budget are used once and dropped.
+            if block[1].nbytes <= self.block_cache_bytes:
+                self._blocks[label] = block
+                self._block_bytes += block[1].nbytes
+                while self._block_bytes > self.block_cache_bytes:
+                    _, (_, evicted) = self._blocks.popitem(last=False)
+                    self._block_bytes -= evicted.nbytes
+        return block
+
+    def query(self, query_embedding, k, labels):
+        ids = self.labels.ids_for(labels)
+        if len(ids) <= max(self.exact_max_articles, k):
+            blocks = [self._block(label) for label in set(labels)]
+            query = normalize_rows(np.atleast_2d(query_embedding))
+            ids = np.concatenate([block_ids for block_ids, _ in blocks])
+            scores = np.concatenate([vectors @ query.T for _, vectors in blocks]).T
+            if not len(ids):
+                return np.empty((1, 0), np.uint64), np.empty((1, 0), np.float32)
+            found, distances = top_k(scores, k)
+            return ids[found].astype(np.uint64), distances
+
+        allowed = np.zeros(self.labels.size, dtype=bool)
+        allowed[ids] = True
+        try:
+            return self.index.query_filtered(query_embedding, k, allowed)
+        except RuntimeError:
+            return query_subset(self.vectors, ids, query_embedding, k)
@@ -0,0 +1,33 @@
+# Multi-process serving mode:
+#
+#     gunicorn -c gunicorn.conf.py app:app
+#
+# The app is imported once in the master process before the workers are forked,
+# so the model weights, the HNSW graph and the memory-mapped article store are
+# shared copy-on-write by every worker instead of being loaded once per worker.
+# GET /admin/memory reports the resident memory of the worker that serves it and
+# benchmarks/memory_report.py reports it for every worker of a running server.
+# A bundle loaded later by POST /admin/reload is loaded by every worker on its
+# own (see RELOAD_CONTROL_PATH in config.py), so its model and index take memory
+# in each worker until the server is restarted.
+import gc
+import os
+import sys
+
+bind = os.environ.get("SYNAPTIC_BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("SYNAPTIC_WORKERS", 4))
+threads = int(os.environ.get("SYNAPTIC_THREADS", 4))
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Move everything allocated during preload into the permanent generation,
+    # so the garbage collector never touches (and copies) those pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # torch is only loaded by the torch encoder backends.
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(int(os.environ.get("SYNAPTIC_TORCH_THREADS", 1)))
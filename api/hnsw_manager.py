@@ -1,15 +1,324 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
 import hnswlib
+import numpy as np
+
+from search_engine import SearchEngine
+
+logger = logging.getLogger(__name__)
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def default_index_path(embeddings_path):
+    return os.path.splitext(embeddings_path)[0] + ".hnsw"
+
+
+class ReadWriteLock:
+    """
+    Allows any number of concurrent readers or a single writer. A waiting
+    writer goes first: new readers wait behind it, so a steady stream of
+    queries cannot starve add_items or mark_deleted.
+    """
 
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writers_waiting = 0
+        self._writing = False
 
-class HNSWIndexManager:
-    def __init__(self, embeddings, space="cosine", dim=None, ef_construction=200, M=16):
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writing or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._writers_waiting += 1
+            try:
+                while self._writing or self._readers:
+                    self._condition.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class HNSWIndexManager(SearchEngine):
+    name = "hnsw"
+
+    def __init__(
+        self,
+        embeddings,
+        space="cosine",
+        dim=None,
+        ef_construction=200,
+        M=16,
+        ef=50,
+        num_threads=-1,
+        chunk_size=10000,
+    ):
         self.dim = dim if dim else embeddings.shape[1]
+        self.space = space
+        self.ef_construction = ef_construction
+        self.M = M
+        self.ef = ef
+        self.num_threads = num_threads
+        self.fingerprint = None
+        self._lock = ReadWriteLock()
         self.index = hnswlib.Index(space=space, dim=self.dim)
         self.index.init_index(
             max_elements=len(embeddings), ef_construction=ef_construction, M=M
         )
-        self.index.add_items(embeddings)
-        self.index.set_ef(50)
+        # Chunks keep only a slice of memory-mapped embeddings resident while
+        # every chunk is inserted on num_threads threads (-1 uses every core).
+        start_time = time.perf_counter()
+        for start in range(0, len(embeddings), chunk_size):
+            chunk = np.asarray(embeddings[start : start + chunk_size], np.float32)
+            end = start + len(chunk)
+            self.index.add_items(chunk, np.arange(start, end), num_threads=num_threads)
+            logger.info(
+                "Indexed %d/%d vectors in %.1fs",
+                end,
+                len(embeddings),
+                time.perf_counter() - start_time,
+            )
+        self.index.set_ef(1)
+
+    @classmethod
+    def load_or_build(
+        cls,
+        embeddings_path,
+        index_path=None,
+        space="cosine",
+        ef_construction=200,
+        M=16,
+        ef=50,
+        num_threads=-1,
+        rebuild=False,
+        deleted_ids=(),
+        embeddings_sha256=None,
+    ):
+        """
+        Loads the index artifact saved next to the embeddings, or builds and
+        saves it when the artifact is missing or its fingerprint does not match
+        the current embeddings file and build parameters. deleted_ids are
+        marked deleted again after a rebuild. embeddings_sha256 spares hashing
+        the embeddings file when the caller already has its fingerprint.
+        """
+        index_path = index_path or default_index_path(embeddings_path)
+        fingerprint = cls.build_fingerprint(
+            embeddings_path, space, ef_construction, M, embeddings_sha256
+        )
+
+        metadata = cls._read_metadata(index_path)
+        if not rebuild and metadata and metadata["fingerprint"] == fingerprint:
+            return cls._load(index_path, metadata, ef, num_threads)
+
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        manager = cls(
+            embeddings,
+            space=space,
+            ef_construction=ef_construction,
+            M=M,
+            ef=ef,
+            num_threads=num_threads,
+        )
+        for i in deleted_ids:
+            manager.index.mark_deleted(int(i))
+        manager.save(index_path, fingerprint)
+        return manager
+
+    @staticmethod
+    def build_fingerprint(
+        embeddings_path, space, ef_construction, M, embeddings_sha256=None
+    ):
+        return {
+            "embeddings_sha256": embeddings_sha256 or file_fingerprint(embeddings_path),
+            "space": space,
+            "ef_construction": ef_construction,
+            "M": M,
+        }
+
+    @classmethod
+    def _load(cls, index_path, metadata, ef, num_threads=-1):
+        manager = cls.__new__(cls)
+        manager.dim = metadata["dim"]
+        manager.space = metadata["fingerprint"]["space"]
+        manager.ef_construction = metadata["fingerprint"]["ef_construction"]
+        manager.M = metadata["fingerprint"]["M"]
+        manager.ef = ef
+        manager.num_threads = num_threads
+        manager.fingerprint = metadata["fingerprint"]
+        manager._lock = ReadWriteLock()
+        manager.index = hnswlib.Index(space=manager.space, dim=manager.dim)
+        manager.index.load_index(
+            index_path, max_elements=metadata.get("capacity", metadata["count"])
+        )
+        manager.index.set_ef(1)
+        return manager
+
+    @staticmethod
+    def _read_metadata(index_path):
+        metadata_path = index_path + ".json"
+        if not (os.path.exists(index_path) and os.path.exists(metadata_path)):
+            return None
+        with open(metadata_path) as f:
+            return json.load(f)
+
+    def save(self, index_path, fingerprint):
+        # Write to temporary files first so a crash never leaves a half-written
+        # index behind a valid-looking metadata file.
+        tmp_index_path = index_path + ".tmp"
+        with self._lock.read():
+            self.index.save_index(tmp_index_path)
+            metadata = {
+                "fingerprint": fingerprint,
+                "dim": self.dim,
+                "count": self.index.get_current_count(),
+                "capacity": self.index.get_max_elements(),
+            }
+        os.replace(tmp_index_path, index_path)
+
+        tmp_metadata_path = index_path + ".json.tmp"
+        with open(tmp_metadata_path, "w") as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(tmp_metadata_path, index_path + ".json")
+        self.fingerprint = fingerprint
+
+    def persist(self, embeddings_path, index_path, embeddings_sha256=None):
+        # Saves the index together with the fingerprint of the updated
+        # embeddings file, so the next load does not rebuild it.
+        fingerprint = self.build_fingerprint(
+            embeddings_path, self.space, self.ef_construction, self.M, embeddings_sha256
+        )
+        self.save(index_path, fingerprint)
+
+    def __len__(self):
+        return self.index.get_current_count()
+
+    def add_items(self, embeddings, ids):
+        # Resizing reallocates the graph, so it must not run while a query is
+        # in progress. Capacity grows geometrically to keep resizes rare.
+        with self._lock.write():
+            needed = self.index.get_current_count() + len(ids)
+            capacity = self.index.get_max_elements()
+            if needed > capacity:
+                self.index.resize_index(max(needed, 2 * capacity))
+            self.index.add_items(embeddings, ids, num_threads=self.num_threads)
+
+    def mark_deleted(self, ids):
+        with self._lock.write():
+            for i in ids:
+                self.index.mark_deleted(int(i))
+
+    def query(self, query_embedding, k, ef=None):
+        # A batch of queries is split across num_threads threads.
+        return self._search(query_embedding, k, self.ef if ef is None else ef)
+
+    def query_filtered(self, query_embedding, k, allowed):
+        # hnswlib skips ids rejected by the filter while it walks the graph,
+        # and raises RuntimeError when it cannot find k allowed ids.
+        return self._search(
+            query_embedding, k, self.ef, filter=lambda i: bool(allowed[i])
+        )
+
+    def _search(self, query_embedding, k, ef, filter=None):
+        # hnswlib searches with max(ef, k), but keeps ef on the index, shared
+        # by concurrent queries. The index's own ef stays at 1 and a query
+        # asks for max(k, ef) results instead, then keeps the best k: the same
+        # search, so queries with different ef never wait for each other.
+        try:
+            with self._lock.read():
+                ids, distances = self.index.knn_query(
+                    query_embedding,
+                    max(k, min(ef, len(self))),
+                    num_threads=self.num_threads,
+                    filter=filter,
+                )
+            return ids[:, :k], distances[:, :k]
+        except RuntimeError:
+            if ef <= k:
+                raise
+        # Fewer than ef articles could be returned, e.g. deleted or filtered
+        # out; ef is set on the index for this query alone.
+        with self._lock.write():
+            self.index.set_ef(ef)
+            try:
+                return self.index.knn_query(
+                    query_embedding, k, num_threads=self.num_threads, filter=filter
+                )
+            finally:
+                self.index.set_ef(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the HNSW index artifact for an embeddings file."
+    )
+    parser.add_argument(
+        "--embeddings-path",
+        type=str,
+        default=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "embeddings", "embeddings.npy"
+        ),
+        help="Path to the embeddings .npy file.",
+    )
+    parser.add_argument(
+        "--index-path",
+        type=str,
+        default=None,
+        help="Where to save the index. Defaults to next to the embeddings.",
+    )
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--M", type=int, default=16)
+    parser.add_argument(
+        "--num-threads",
+        type=int,
+        default=-1,
+        help="Threads used to build the index. Defaults to every core.",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Rebuild even if the saved index matches the embeddings.",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
 
-    def query(self, query_embedding, k):
-        return self.index.knn_query(query_embedding, k)
+    HNSWIndexManager.load_or_build(
+        args.embeddings_path,
+        args.index_path,
+        ef_construction=args.ef_construction,
+        M=args.M,
+        num_threads=args.num_threads,
+        rebuild=args.rebuild,
+    )
@@ -0,0 +1,287 @@
+import argparse
+import fcntl
+import io
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from article_store import COLUMNS, ArticleStore
+from config import (
+    ARTICLES_DIR,
+    DATA_PATH,
+    EMBEDDINGS_PATH,
+    HNSW_EF,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_M,
+    HNSW_NUM_THREADS,
+    INDEX_PATH,
+    INGEST_BATCH_SIZE,
+    MODEL_NAME,
+    NEIGHBOR_COUNT,
+)
+from corpus_embeddings import update_manifest
+from hnsw_manager import HNSWIndexManager, file_fingerprint
+from neighbors import NeighborTable
+from utils import get_text_normalizer
+
+# Serializes writers within a process; readers are never blocked by it.
+write_lock = threading.Lock()
+
+
+@contextmanager
+def corpus_lock(embeddings_path):
+    """
+    Serializes writers of a corpus across threads and processes, e.g. the
+    workers of a gunicorn server, with write_lock and an exclusive flock on a
+    lock file next to the embeddings. The flock is released when the file is
+    closed, including when the process dies.
+    """
+    with write_lock, open(embeddings_path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def catch_up(store, index, embeddings_path, neighbors=None):
+    """
+    Re-reads the store and applies the articles other processes appended or
+    deleted since this one last read it to the index and the neighbor table.
+    Callers hold write_lock.
+    """
+    rows, deleted = len(store), store.deleted
+    store.refresh()
+    if len(index) < len(store) or (
+        neighbors is not None and len(neighbors) < len(store)
+    ):
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        start = len(index)
+        if start < len(store):
+            index.add_items(
+                np.asarray(embeddings[start : len(store)], dtype=np.float32),
+                np.arange(start, len(store)),
+            )
+        if neighbors is not None and len(neighbors) < len(store):
+            start = len(neighbors)
+            neighbors.add_items(
+                index, embeddings[start : len(store)], np.arange(start, len(store))
+            )
+
+    known = np.zeros(len(store), dtype=bool)
+    known[:rows] = deleted[:rows]
+    removed = np.flatnonzero(store.deleted[: len(store)] & ~known)
+    if len(removed):
+        index.mark_deleted(removed)
+
+
+# SHA-256 of embeddings files by path, with the (inode, size, mtime) it was
+# computed for; every write to the file changes its mtime.
+_fingerprints = {}
+
+
+def embeddings_fingerprint(embeddings_path):
+    """
+    Returns file_fingerprint(embeddings_path), hashing the file again only
+    when it changed since the last call, e.g. when another process appended
+    to it. Deletions leave the file as it is, so they never hash it.
+    """
+    stat = os.stat(embeddings_path)
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    known = _fingerprints.get(embeddings_path)
+    if known is not None and known[0] == key:
+        return known[1]
+    sha256 = file_fingerprint(embeddings_path)
+    _fingerprints[embeddings_path] = (key, sha256)
+    return sha256
+
+
+def encode_articles(model, records, batch_size=INGEST_BATCH_SIZE):
+    texts = get_text_normalizer().normalize_batch(
+        [record["Text"] for record in records]
+    )
+    return np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+# Header writers by .npy format version. Both pad the header so the leading
+# dimension can grow without moving the data.
+HEADER_WRITERS = {
+    (1, 0): np.lib.format.write_array_header_1_0,
+    (2, 0): np.lib.format.write_array_header_2_0,
+}
+
+
+def append_embeddings(embeddings_path, new_embeddings, start):
+    """
+    Writes new_embeddings as rows start, start + 1, ... of the .npy file and
+    drops any rows past them left by an interrupted ingestion, so row i stays
+    article i. The rows are written in place and only the header's shape is
+    rewritten, after them, so appending costs the same whatever the corpus
+    size, and processes that mapped the file keep reading valid rows.
+    """
+    existing = np.load(embeddings_path, mmap_mode="r")
+    dtype, dim, offset = existing.dtype, existing.shape[1], existing.offset
+    in_place = existing.flags.c_contiguous
+    del existing
+    new_embeddings = np.ascontiguousarray(new_embeddings, dtype=dtype)
+
+    with open(embeddings_path, "r+b") as f:
+        write_header = HEADER_WRITERS.get(np.lib.format.read_magic(f))
+        header = io.BytesIO()
+        if write_header is not None and in_place:
+            write_header(
+                header,
+                {
+                    "descr": np.lib.format.dtype_to_descr(dtype),
+                    "fortran_order": False,
+                    "shape": (start + len(new_embeddings), dim),
+                },
+            )
+        if header.tell() == offset:
+            f.seek(offset + start * dim * dtype.itemsize)
+            f.write(new_embeddings.tobytes())
+            f.truncate()
+            f.flush()
+            f.seek(0)
+            f.write(header.getvalue())
+            return
+    # Files whose header has no room for the new shape are rewritten once;
+    # np.save leaves room, so later appends happen in place.
+    _rewrite_embeddings(embeddings_path, new_embeddings, start)
+
+
+def _rewrite_embeddings(embeddings_path, new_embeddings, start, chunk_size=65536):
+    # Streams the existing rows into a new file, so memory stays bounded.
+    existing = np.load(embeddings_path, mmap_mode="r")
+    tmp_path = embeddings_path + ".tmp"
+    combined = np.lib.format.open_memmap(
+        tmp_path,
+        mode="w+",
+        dtype=existing.dtype,
+        shape=(start + len(new_embeddings), existing.shape[1]),
+    )
+    for offset in range(0, start, chunk_size):
+        end = min(offset + chunk_size, start)
+        combined[offset:end] = existing[offset:end]
+    combined[start:] = new_embeddings
+    combined.flush()
+    del combined
+    os.replace(tmp_path, embeddings_path)
+
+
+def add_articles(
+    records,
+    model,
+    store,
+    index,
+    embeddings_path,
+    index_path,
+    batch_size,
+    neighbors=None,
+):
+    """
+    Encodes the records and appends them to the article store, embeddings.npy
+    and the index, then persists the index and the embeddings manifest. When a
+    neighbor table is given, it is updated and persisted too. Returns the ids
+    of the new articles. Articles added by other processes are caught up
+    with first, so the ids continue theirs. The embeddings file is hashed
+    once, for every artifact that records its fingerprint.
+    """
+    embeddings = encode_articles(model, records, batch_size)
+    with corpus_lock(embeddings_path):
+        catch_up(store, index, embeddings_path, neighbors)
+        append_embeddings(embeddings_path, embeddings, len(store))
+        ids = store.append(records)
+        embeddings_sha256 = embeddings_fingerprint(embeddings_path)
+        update_manifest(embeddings_path, store, embeddings_sha256)
+        index.add_items(embeddings, ids)
+        index.persist(embeddings_path, index_path, embeddings_sha256)
+        if neighbors is not None:
+            neighbors.add_items(index, embeddings, ids)
+            neighbors.persist(embeddings_path, embeddings_sha256=embeddings_sha256)
+    return ids
+
+
+def delete_articles(ids, store, index, embeddings_path, index_path, neighbors=None):
+    with corpus_lock(embeddings_path):
+        catch_up(store, index, embeddings_path, neighbors)
+        unknown = [i for i in ids if not store.is_live(i)]
+        if unknown:
+            raise KeyError(unknown)
+        store.delete(ids)
+        index.mark_deleted(ids)
+        index.persist(
+            embeddings_path, index_path, embeddings_fingerprint(embeddings_path)
+        )
+
+
+def read_records(path):
+    import pandas as pd
+
+    data = pd.read_excel(path) if path.endswith(".xlsx") else pd.read_csv(path)
+    return [
+        {
+            column: "" if pd.isna(value) else str(value)
+            for column, value in zip(COLUMNS, values)
+        }
+        for values in data[COLUMNS].itertuples(index=False)
+    ]
+
+
+def main(args):
+    store = ArticleStore.open_or_convert(ARTICLES_DIR, DATA_PATH)
+    embeddings_sha256 = embeddings_fingerprint(EMBEDDINGS_PATH)
+    index = HNSWIndexManager.load_or_build(
+        EMBEDDINGS_PATH,
+        INDEX_PATH,
+        ef_construction=HNSW_EF_CONSTRUCTION,
+        M=HNSW_M,
+        ef=HNSW_EF,
+        num_threads=HNSW_NUM_THREADS,
+        deleted_ids=store.deleted_ids(),
+        embeddings_sha256=embeddings_sha256,
+    )
+    neighbors = NeighborTable.load_or_build(
+        index,
+        EMBEDDINGS_PATH,
+        top_n=NEIGHBOR_COUNT,
+        embeddings_sha256=embeddings_sha256,
+    )
+
+    if args.command == "add":
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(MODEL_NAME)
+        ids = add_articles(
+            read_records(args.path),
+            model,
+            store,
+            index,
+            EMBEDDINGS_PATH,
+            INDEX_PATH,
+            args.batch_size,
+            neighbors,
+        )
+        print(f"Added {len(ids)} articles with ids {ids[0]}-{ids[-1]}")
+    else:
+        delete_articles(args.ids, store, index, EMBEDDINGS_PATH, INDEX_PATH, neighbors)
+        print(f"Deleted {len(args.ids)} articles")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Add articles to, or delete articles from, the serving corpus."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser(
+        "add", help="Encode and add the articles in an Excel or CSV file."
+    )
+    add_parser.add_argument(
+        "path", type=str, help=f"File with the columns {', '.join(COLUMNS)}."
+    )
+    add_parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+
+    delete_parser = subparsers.add_parser("delete", help="Delete articles by id.")
+    delete_parser.add_argument("ids", type=int, nargs="+")
+
+    main(parser.parse_args())
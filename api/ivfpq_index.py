@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from hnsw_manager import file_fingerprint
+from quantized_index import normalize_rows
+from search_engine import SearchEngine
+
+
+def nearest_centroids(vectors, centroids, chunk_size=16384):
+    centroid_norms = (centroids**2).sum(axis=1)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start : start + chunk_size]
+        distances = centroid_norms - 2 * chunk @ centroids.T
+        assignments[start : start + len(chunk)] = distances.argmin(axis=1)
+    return assignments
+
+
+def kmeans(vectors, k, iterations=20, seed=0):
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest_centroids(vectors, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        empty = counts == 0
+        # Sum the members of every cluster with one pass over sorted rows.
+        order = np.argsort(assignments, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[~empty]
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        centroids[~empty] = sums / counts[~empty, None]
+        # Restart empty clusters from random training vectors.
+        centroids[empty] = vectors[rng.choice(len(vectors), size=empty.sum())]
+    return centroids
+
+
+class IVFPQIndex(SearchEngine):
+    """
+    Inverted-file index with product-quantized residuals. Vectors are
+    normalized and assigned to the nearest of nlist coarse centroids, and each
+    residual is stored as m one-byte codes, one per subspace of dim / m
+    dimensions. A query scans the nprobe closest lists with per-subspace
+    distance tables. With rerank_candidates set, the best candidates are
+    re-scored exactly from the memory-mapped float32 embeddings.
+    """
+
+    name = "ivfpq"
+
+    def __init__(self, centroids, codebooks, nprobe=16, rerank_candidates=64):
+        self.centroids = centroids
+        self.codebooks = codebooks
+        self.dim = centroids.shape[1]
+        self.m = len(codebooks)
+        self.dsub = self.dim // self.m
+        self.nprobe = nprobe
+        self.rerank_candidates = rerank_candidates
+        self.codebook_norms = (codebooks**2).sum(axis=2)
+        self.vectors = None
+        self.embeddings_path = None
+        self.fingerprint = None
+        # (ids, codes) of every inverted list. A list is replaced by a new
+        # tuple when it grows, so a concurrent query reads ids and codes of
+        # the same version.
+        self.lists = [
+            (np.empty(0, dtype=np.int64), np.empty((0, self.m), dtype=np.uint8))
+            for _ in centroids
+        ]
+        self.deleted = np.zeros(0, dtype=bool)
+
+    @classmethod
+    def train(cls, vectors, nlist, m, train_size=100000, seed=0, **kwargs):
+        dim = vectors.shape[1]
+        if dim % m:
+            raise ValueError(f"m={m} must divide the embedding dimension {dim}.")
+        rng = np.random.default_rng(seed)
+        rows = np.sort(
+            rng.choice(len(vectors), size=min(train_size, len(vectors)), replace=False)
+        )
+        sample = normalize_rows(vectors[rows])
+
+        centroids = kmeans(sample, nlist, seed=seed)
+        residuals = sample - centroids[nearest_centroids(sample, centroids)]
+        dsub = dim // m
+        codebooks = np.stack(
+            [
+                kmeans(residuals[:, j * dsub : (j + 1) * dsub], 256, seed=seed + j)
+                for j in range(m)
+            ]
+        )
+        return cls(centroids, codebooks, **kwargs)
+
+    def _encode(self, residuals):
+        codes = np.empty((len(residuals), self.m), dtype=np.uint8)
+        for j, codebook in enumerate(self.codebooks):
+            subvectors = residuals[:, j * self.dsub : (j + 1) * self.dsub]
+            codes[:, j] = nearest_centroids(subvectors, codebook)
+        return codes
+
+    def __len__(self):
+        return len(self.deleted)
+
+    def memory_bytes(self):
+        lists = sum(ids.nbytes + codes.nbytes for ids, codes in self.lists)
+        return lists + self.centroids.nbytes + self.codebooks.nbytes
+
+    def add_items(self, embeddings, ids, chunk_size=65536):
+        ids = np.asarray(ids, dtype=np.int64)
+        self.deleted = np.concatenate(
+            [self.deleted, np.zeros(max(0, ids.max() + 1 - len(self.deleted)), bool)]
+        )
+        # embeddings.npy was extended first; it is re-opened before the lists
+        # grow, so re-ranking finds the new rows.
+        if self.vectors is not None:
+            self.attach_vectors(self.embeddings_path)
+        for start in range(0, len(ids), chunk_size):
+            chunk = normalize_rows(embeddings[start : start + chunk_size])
+            chunk_ids = ids[start : start + chunk_size]
+            assignments = nearest_centroids(chunk, self.centroids)
+            codes = self._encode(chunk - self.centroids[assignments])
+            for list_id in np.unique(assignments):
+                members = assignments == list_id
+                list_ids, list_codes = self.lists[list_id]
+                self.lists[list_id] = (
+                    np.concatenate([list_ids, chunk_ids[members]]),
+                    np.concatenate([list_codes, codes[members]]),
+                )
+
+    def attach_vectors(self, embeddings_path):
+        self.embeddings_path = embeddings_path
+        self.vectors = np.load(embeddings_path, mmap_mode="r")
+
+    def mark_deleted(self, ids):
+        deleted = self.deleted.copy()
+        deleted[np.asarray(ids, dtype=np.int64)] = True
+        self.deleted = deleted
+
+    def _search_one(self, query, k):
+        coarse = ((self.centroids - query) ** 2).sum(axis=1)
+        probes = np.argsort(coarse)[: self.nprobe]
+
+        candidate_ids, candidate_distances = [], []
+        subspaces = np.arange(self.m)
+        for list_id in probes:
+            ids, codes = self.lists[list_id]
+            if not len(ids):
+                continue
+            # ||r - c||^2 per subspace and code, expanded to avoid a
+            # (m, 256, dsub) temporary.
+            residual = (query - self.centroids[list_id]).reshape(self.m, self.dsub)
+            tables = (
+                self.codebook_norms
+                - 2 * np.einsum("jd,jkd->jk", residual, self.codebooks)
+                + (residual**2).sum(axis=1, keepdims=True)
+            )
+            candidate_ids.append(ids)
+            candidate_distances.append(tables[subspaces, codes].sum(axis=1))
+        if not candidate_ids:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+
+        # Read after the lists: flags grow before the lists do, so they cover
+        # every id found.
+        deleted = self.deleted
+        ids = np.concatenate(candidate_ids)
+        # Squared L2 between unit vectors is 2 - 2 * cosine.
+        distances = np.concatenate(candidate_distances) / 2
+        distances[deleted[ids]] = np.inf
+
+        if self.rerank_candidates and self.vectors is not None:
+            keep = min(max(self.rerank_candidates, k), len(ids))
+            best = np.argpartition(distances, keep - 1)[:keep]
+            ids = np.sort(ids[best])
+            distances = 1 - normalize_rows(self.vectors[ids]) @ query
+            distances[deleted[ids]] = np.inf
+
+        best = np.argsort(distances)[:k]
+        return ids[best], distances[best]
+
+    def query(self, query_embedding, k, ef=None):
+        queries = normalize_rows(np.atleast_2d(query_embedding))
+        ids = np.zeros((len(queries), k), dtype=np.uint64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for row, query in enumerate(queries):
+            found_ids, found_distances = self._search_one(query, k)
+            ids[row, : len(found_ids)] = found_ids
+            distances[row, : len(found_ids)] = found_distances
+        return ids, distances
+
+    def save(self, path, fingerprint):
+        offsets = np.cumsum([0] + [len(ids) for ids, _ in self.lists])
+        metadata = {"fingerprint": fingerprint, "nprobe": self.nprobe}
+        with open(path + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                codebooks=self.codebooks,
+                ids=np.concatenate([ids for ids, _ in self.lists]),
+                codes=np.concatenate([codes for _, codes in self.lists]),
+                offsets=offsets,
+                deleted=self.deleted,
+                metadata=np.array(json.dumps(metadata)),
+            )
+        os.replace(path + ".tmp", path)
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with np.load(path) as data:
+            index = cls(data["centroids"], data["codebooks"], **kwargs)
+            offsets = data["offsets"]
+            ids, codes = data["ids"], data["codes"]
+            index.lists = [
+                (ids[a:b], codes[a:b]) for a, b in zip(offsets[:-1], offsets[1:])
+            ]
+            index.deleted = data["deleted"]
+            index.fingerprint = json.loads(str(data["metadata"]))["fingerprint"]
+        return index
+
+    @staticmethod
+    def build_fingerprint(embeddings_path, nlist, m, embeddings_sha256=None):
+        return {
+            "embeddings_sha256": embeddings_sha256 or file_fingerprint(embeddings_path),
+            "nlist": nlist,
+            "m": m,
+        }
+
+    @classmethod
+    def load_or_build(
+        cls,
+        embeddings_path,
+        index_path,
+        nlist=1024,
+        m=48,
+        nprobe=16,
+        rerank_candidates=64,
+        deleted_ids=(),
+        rebuild=False,
+        embeddings_sha256=None,
+    ):
+        """
+        Loads the saved index when its fingerprint matches the embeddings file
+        and parameters, otherwise trains, fills and saves a new one.
+        """
+        fingerprint = cls.build_fingerprint(
+            embeddings_path, nlist, m, embeddings_sha256
+        )
+        options = {"nprobe": nprobe, "rerank_candidates": rerank_candidates}
+
+        index = None
+        if not rebuild and os.path.exists(index_path):
+            index = cls.load(index_path, **options)
+            if index.fingerprint != fingerprint:
+                index = None
+        if index is None:
+            vectors = np.load(embeddings_path, mmap_mode="r")
+            index = cls.train(vectors, nlist, m, **options)
+            index.add_items(vectors, np.arange(len(vectors)))
+            index.mark_deleted(deleted_ids)
+            index.save(index_path, fingerprint)
+
+        index.attach_vectors(embeddings_path)
+        return index
+
+    def persist(self, embeddings_path, index_path, embeddings_sha256=None):
+        # index_path is the bundle's HNSW path; the IVF-PQ artifact lives next
+        # to it, as in ServingBundle.load_index.
+        self.attach_vectors(embeddings_path)
+        self.save(
+            default_ivfpq_path(index_path),
+            dict(
+                self.fingerprint,
+                embeddings_sha256=embeddings_sha256
+                or file_fingerprint(embeddings_path),
+            ),
+        )
+
+
+def default_ivfpq_path(index_path):
+    return os.path.splitext(index_path)[0] + ".ivfpq.npz"
+
+
+if __name__ == "__main__":
+    api_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(
+        description="Train and save the IVF-PQ index for an embeddings file."
+    )
+    parser.add_argument(
+        "--embeddings-path",
+        type=str,
+        default=os.path.join(api_dir, "embeddings", "embeddings.npy"),
+    )
+    parser.add_argument("--index-path", type=str, default=None)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--m", type=int, default=48)
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    IVFPQIndex.load_or_build(
+        args.embeddings_path,
+        args.index_path or default_ivfpq_path(args.embeddings_path),
+        nlist=args.nlist,
+        m=args.m,
+        rebuild=args.rebuild,
+    )
@@ -0,0 +1,284 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in labels.items())
+    return f"{{{pairs}}}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labelvalues, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, labelvalues)), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus expects."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [
+                    [0] * (len(self.buckets) + 1),
+                    0.0,
+                ]
+            series[0][position] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {
+                key: (list(counts), total)
+                for key, (counts, total) in self._series.items()
+            }
+        for labelvalues, (counts, total) in sorted(series.items()):
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", dict(labels, le=bound), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    """
+    Metrics of this process, rendered in the Prometheus text format.
+    Collectors are functions called at scrape time that return
+    (name, type, help, [(labels, value), ...]) tuples, for values such as
+    cache counters that are already tracked elsewhere.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for collect in self.collectors:
+            for name, type, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    "synaptic_requests_total",
+    "HTTP requests by endpoint and status.",
+    ("endpoint", "status"),
+)
+REQUEST_SECONDS = registry.histogram(
+    "synaptic_request_duration_seconds", "HTTP request latency.", ("endpoint",)
+)
+STAGE_SECONDS = registry.histogram(
+    "synaptic_stage_duration_seconds",
+    "Time spent in each stage of the search pipeline.",
+    ("stage",),
+)
+ENCODE_BATCH_SIZE = registry.histogram(
+    "synaptic_encode_batch_size",
+    "Queries encoded per model.encode call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+# Stage timings of the current request, for the Server-Timing header.
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def start_request():
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+@contextmanager
+def timed(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def server_timing(timings, total):
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def observe_request(endpoint, status, seconds):
+    REQUESTS.inc(endpoint, str(status))
+    REQUEST_SECONDS.observe(seconds, endpoint)
+
+
+def service_metrics(bundles, admission):
+    """
+    Collector for the state of the active bundle and of admission control,
+    read from the stats they already keep.
+    """
+    bundle = bundles.active
+    if bundle is None:
+        return []
+    startup = [
+        ({"phase": phase}, seconds)
+        for phase, seconds in bundles.startup["phases"].items()
+    ]
+    caches = {
+        "embeddings": bundle.embedding_cache.stats(),
+        "results": bundle.result_cache.stats(),
+        "cursors": bundle.cursors.stats(),
+    }
+    load = admission.stats()
+    coalescing = bundle.in_flight.stats()
+    return [
+        (
+            "synaptic_startup_phase_seconds",
+            "gauge",
+            "Time spent in each phase of startup, until the first bundle was ready.",
+            startup,
+        ),
+        (
+            "synaptic_cache_hits_total",
+            "counter",
+            "Query cache hits of the active bundle.",
+            [({"cache": name}, stats["hits"]) for name, stats in caches.items()],
+        ),
+        (
+            "synaptic_cache_misses_total",
+            "counter",
+            "Query cache misses of the active bundle.",
+            [({"cache": name}, stats["misses"]) for name, stats in caches.items()],
+        ),
+        (
+            "synaptic_cache_entries",
+            "gauge",
+            "Entries held by each query cache.",
+            [({"cache": name}, stats["size"]) for name, stats in caches.items()],
+        ),
+        (
+            "synaptic_index_vectors",
+            "gauge",
+            "Vectors in the search index, deleted ones included.",
+            [({"engine": bundle.index.name}, len(bundle.index))],
+        ),
+        (
+            "synaptic_articles",
+            "gauge",
+            "Articles in the store, deleted ones included.",
+            [({}, len(bundle.article_store))],
+        ),
+        (
+            "synaptic_searches_running",
+            "gauge",
+            "Searches admitted and running.",
+            [({}, load["running"])],
+        ),
+        (
+            "synaptic_searches_queued",
+            "gauge",
+            "Searches waiting for admission.",
+            [({}, load["queued"])],
+        ),
+        (
+            "synaptic_searches_shed_total",
+            "counter",
+            "Searches answered with 503, by reason.",
+            [
+                ({"reason": "queue_full"}, load["shed_queue_full"]),
+                ({"reason": "deadline"}, load["shed_deadline"]),
+            ],
+        ),
+        (
+            "synaptic_searches_coalesced_total",
+            "counter",
+            "Searches that shared an identical in-flight search.",
+            [({}, coalescing["coalesced"])],
+        ),
+    ]
@@ -0,0 +1,228 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from hnsw_manager import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def default_neighbors_path(embeddings_path):
+    return os.path.splitext(embeddings_path)[0] + ".neighbors"
+
+
+class NeighborTable:
+    """
+    The top_n nearest articles of every article, precomputed with a batched
+    self-kNN query, so "more like this" lookups need neither the encoder nor
+    the index. Neighbor ids (int32, -1 for padding) and distances (float32)
+    are stored as two (n, top_n) .npy files next to a fingerprint of the
+    embeddings they were computed from, and opened memory-mapped.
+    """
+
+    def __init__(self, ids, distances, fingerprint=None):
+        self.ids = ids
+        self.distances = distances
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+
+    @property
+    def top_n(self):
+        return self.ids.shape[1]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def neighbors(self, article_id):
+        ids, distances = self.ids, self.distances
+        if not 0 <= article_id < len(ids):
+            return np.empty(0, np.int32), np.empty(0, np.float32)
+        found = ids[article_id] >= 0
+        return ids[article_id][found], distances[article_id][found]
+
+    @staticmethod
+    def self_knn(index, embeddings, ids, top_n, batch_size=1024):
+        """
+        Queries the index with each row of embeddings, whose article ids are
+        ids, and drops the article itself from its own neighbors.
+        """
+        k = min(top_n + 1, len(index))
+        neighbor_ids = np.full((len(ids), top_n), -1, dtype=np.int32)
+        neighbor_distances = np.full((len(ids), top_n), np.inf, dtype=np.float32)
+        start_time = time.perf_counter()
+        for start in range(0, len(ids), batch_size):
+            batch = np.asarray(embeddings[start : start + batch_size], np.float32)
+            found, distances = index.query(batch, k)
+            found = found.astype(np.int64)
+            keep = found != np.asarray(ids[start : start + len(batch)])[:, None]
+            # Without an exact self match, the farthest result is dropped.
+            keep[keep.all(axis=1), -1] = False
+            found = found[keep].reshape(len(batch), k - 1)
+            distances = distances[keep].reshape(len(batch), k - 1)
+            found[~np.isfinite(distances)] = -1
+            end = start + len(batch)
+            neighbor_ids[start:end, : k - 1] = found
+            neighbor_distances[start:end, : k - 1] = distances
+            logger.info(
+                "Computed neighbors of %d/%d articles in %.1fs",
+                end,
+                len(ids),
+                time.perf_counter() - start_time,
+            )
+        return neighbor_ids, neighbor_distances
+
+    @classmethod
+    def build(cls, index, embeddings_path, top_n=16, batch_size=1024):
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        ids, distances = cls.self_knn(
+            index, embeddings, np.arange(len(embeddings)), top_n, batch_size
+        )
+        return cls(ids, distances)
+
+    def add_items(self, index, embeddings, ids):
+        """
+        Appends rows for new articles, and inserts each new article into the
+        rows of its own neighbors when it is closer than their farthest one.
+        Arrays are replaced, never modified, so readers see a consistent table.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        new_ids, new_distances = self.self_knn(index, embeddings, ids, self.top_n)
+        with self._lock:
+            size = max(int(np.max(ids)) + 1, len(self.ids))
+            table_ids = np.full((size, self.top_n), -1, dtype=np.int32)
+            table_distances = np.full((size, self.top_n), np.inf, dtype=np.float32)
+            table_ids[: len(self.ids)] = self.ids
+            table_distances[: len(self.ids)] = self.distances
+            table_ids[ids] = new_ids
+            table_distances[ids] = new_distances
+
+            for article_id, row_ids, row_distances in zip(ids, new_ids, new_distances):
+                for neighbor, distance in zip(row_ids, row_distances):
+                    # Articles of the same batch already found each other in
+                    # self_knn, so their rows may hold article_id already.
+                    if (
+                        neighbor < 0
+                        or distance >= table_distances[neighbor, -1]
+                        or article_id in table_ids[neighbor]
+                    ):
+                        continue
+                    position = np.searchsorted(table_distances[neighbor], distance)
+                    table_ids[neighbor, position + 1 :] = table_ids[
+                        neighbor, position:-1
+                    ].copy()
+                    table_distances[neighbor, position + 1 :] = table_distances[
+                        neighbor, position:-1
+                    ].copy()
+                    table_ids[neighbor, position] = article_id
+                    table_distances[neighbor, position] = distance
+
+            self.ids, self.distances = table_ids, table_distances
+
+    @staticmethod
+    def build_fingerprint(embeddings_path, top_n, embeddings_sha256=None):
+        return {
+            "embeddings_sha256": embeddings_sha256 or file_fingerprint(embeddings_path),
+            "top_n": top_n,
+        }
+
+    def save(self, path, fingerprint):
+        # The arrays are written under temporary names and moved into place
+        # before the metadata, like the HNSW index artifact.
+        for suffix, array in (
+            (".ids.npy", self.ids),
+            (".distances.npy", self.distances),
+        ):
+            with open(path + suffix + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(path + suffix + ".tmp", path + suffix)
+        with open(path + ".json.tmp", "w") as f:
+            json.dump({"fingerprint": fingerprint, "count": len(self)}, f, indent=2)
+        os.replace(path + ".json.tmp", path + ".json")
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def load(cls, path):
+        with open(path + ".json") as f:
+            metadata = json.load(f)
+        return cls(
+            np.load(path + ".ids.npy", mmap_mode="r"),
+            np.load(path + ".distances.npy", mmap_mode="r"),
+            metadata["fingerprint"],
+        )
+
+    @classmethod
+    def load_or_build(
+        cls,
+        index,
+        embeddings_path,
+        path=None,
+        top_n=16,
+        rebuild=False,
+        embeddings_sha256=None,
+    ):
+        """
+        Loads the saved table when its fingerprint matches the embeddings file
+        and top_n, otherwise computes it with the index and saves it.
+        """
+        path = path or default_neighbors_path(embeddings_path)
+        fingerprint = cls.build_fingerprint(embeddings_path, top_n, embeddings_sha256)
+        if not rebuild and os.path.exists(path + ".json"):
+            table = cls.load(path)
+            if table.fingerprint == fingerprint:
+                return table
+
+        table = cls.build(index, embeddings_path, top_n)
+        table.save(path, fingerprint)
+        return table
+
+    def persist(self, embeddings_path, path=None, embeddings_sha256=None):
+        # Saves the table with the fingerprint of the updated embeddings file,
+        # so the next load does not recompute it.
+        self.save(
+            path or default_neighbors_path(embeddings_path),
+            self.build_fingerprint(embeddings_path, self.top_n, embeddings_sha256),
+        )
+
+
+if __name__ == "__main__":
+    from config import (
+        ARTICLES_DIR,
+        EMBEDDINGS_PATH,
+        HNSW_EF,
+        HNSW_EF_CONSTRUCTION,
+        HNSW_M,
+        HNSW_NUM_THREADS,
+        INDEX_PATH,
+        NEIGHBOR_COUNT,
+    )
+    from article_store import ArticleStore
+    from hnsw_manager import HNSWIndexManager
+
+    parser = argparse.ArgumentParser(
+        description="Precompute the nearest neighbors of every article."
+    )
+    parser.add_argument("--embeddings-path", type=str, default=EMBEDDINGS_PATH)
+    parser.add_argument("--index-path", type=str, default=INDEX_PATH)
+    parser.add_argument("--articles-dir", type=str, default=ARTICLES_DIR)
+    parser.add_argument("--top-n", type=int, default=NEIGHBOR_COUNT)
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    index = HNSWIndexManager.load_or_build(
+        args.embeddings_path,
+        args.index_path,
+        ef_construction=HNSW_EF_CONSTRUCTION,
+        M=HNSW_M,
+        ef=HNSW_EF,
+        num_threads=HNSW_NUM_THREADS,
+        deleted_ids=ArticleStore(args.articles_dir).deleted_ids(),
+    )
+    NeighborTable.load_or_build(
+        index, args.embeddings_path, top_n=args.top_n, rebuild=args.rebuild
+    )
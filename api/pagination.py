@@ -0,0 +1,61 @@
+import base64
+import secrets
+
+import orjson
+
+from config import ACCURACY_TIERS, PAGE_CANDIDATES
+
+
+class Cursor:
+    """
+    Position in the candidate list of a search. The list is cached by the
+    bundle under the cursor's token; the cursor also carries the normalized
+    query, labels and ef, so a process that does not hold the list, or holds
+    an expired one, can search again instead of failing. Cursors are passed
+    to clients as opaque URL-safe strings.
+    """
+
+    __slots__ = ("query", "labels", "ef", "token", "offset")
+
+    def __init__(self, query, labels=None, ef=None, token=None, offset=0):
+        self.query = query
+        self.labels = sorted(set(labels)) if labels else None
+        self.ef = ef
+        self.token = token or secrets.token_urlsafe(12)
+        self.offset = offset
+
+    def at(self, offset):
+        return Cursor(self.query, self.labels, self.ef, self.token, offset)
+
+    def encode(self):
+        state = [self.token, self.offset, self.query, self.labels, self.ef]
+        return base64.urlsafe_b64encode(orjson.dumps(state)).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, value):
+        # Raises ValueError for anything that is not a cursor this class made.
+        # Cursors are not signed, so every field is checked: offsets stay
+        # within PAGE_CANDIDATES and ef is one of the accuracy tiers'.
+        try:
+            padded = value + "=" * (-len(value) % 4)
+            token, offset, query, labels, ef = orjson.loads(
+                base64.urlsafe_b64decode(padded)
+            )
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor!")
+        if not (
+            isinstance(token, str)
+            and type(offset) is int
+            and 0 <= offset <= PAGE_CANDIDATES
+            and isinstance(query, str)
+            and (
+                labels is None
+                or (
+                    isinstance(labels, list)
+                    and all(isinstance(label, str) for label in labels)
+                )
+            )
+            and (ef is None or (type(ef) is int and ef in ACCURACY_TIERS.values()))
+        ):
+            raise ValueError("Invalid cursor!")
+        return cls(query, labels, ef, token, offset)
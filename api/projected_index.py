@@ -0,0 +1,303 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from hnsw_manager import HNSWIndexManager, file_fingerprint
+from quantized_index import normalize_rows
+from search_engine import SearchEngine
+
+
+class Projection:
+    """
+    Linear map from the embedding space to its top dim principal directions,
+    fitted on normalized embeddings without centering them (a truncated SVD),
+    so the inner products that cosine similarity ranks by are preserved as
+    well as dim directions allow.
+    """
+
+    def __init__(self, components, explained_variance):
+        self.components = np.asarray(components, dtype=np.float32)
+        self.explained_variance = np.asarray(explained_variance, dtype=np.float32)
+        self.dim, self.source_dim = self.components.shape
+        self.fingerprint = None
+
+    @classmethod
+    def fit(cls, vectors, dim, sample_size=100000, seed=0, chunk_size=16384):
+        if not 0 < dim <= vectors.shape[1]:
+            raise ValueError(
+                f"dim={dim} must be between 1 and the embedding dimension "
+                f"{vectors.shape[1]}."
+            )
+        rng = np.random.default_rng(seed)
+        rows = np.sort(
+            rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False)
+        )
+        # The (source_dim, source_dim) second-moment matrix is summed over
+        # chunks, so the sample never needs to be resident as float32 at once.
+        moment = np.zeros((vectors.shape[1],) * 2, dtype=np.float64)
+        for start in range(0, len(rows), chunk_size):
+            chunk = normalize_rows(vectors[rows[start : start + chunk_size]])
+            moment += chunk.T.astype(np.float64) @ chunk
+        eigenvalues, eigenvectors = np.linalg.eigh(moment / len(rows))
+        top = np.argsort(eigenvalues)[::-1][:dim]
+        explained = eigenvalues[top] / eigenvalues.sum()
+        return cls(eigenvectors[:, top].T, explained)
+
+    def project(self, vectors):
+        return normalize_rows(vectors) @ self.components.T
+
+    def save(self, path, fingerprint):
+        with open(path + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                components=self.components,
+                explained_variance=self.explained_variance,
+                metadata=np.array(json.dumps({"fingerprint": fingerprint})),
+            )
+        os.replace(path + ".tmp", path)
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            projection = cls(data["components"], data["explained_variance"])
+            projection.fingerprint = json.loads(str(data["metadata"]))["fingerprint"]
+        return projection
+
+
+class ProjectedIndex(SearchEngine):
+    """
+    HNSW index over embeddings projected to a few principal directions, so
+    the graph stores and compares dim-sized vectors instead of full ones.
+    Queries are projected with the same matrix, the best rerank_candidates
+    are fetched from the graph and re-scored with exact float32 scores read
+    from the memory-mapped embeddings file. Distances are 1 - cosine at full
+    dimension, like hnswlib's cosine space.
+    """
+
+    name = "projected"
+
+    def __init__(self, projection, graph, embeddings_path, rerank_candidates=64):
+        self.projection = projection
+        self.graph = graph
+        self.embeddings_path = embeddings_path
+        self.rerank_candidates = rerank_candidates
+        self.vectors = np.load(embeddings_path, mmap_mode="r")
+        self.deleted = np.zeros(len(self.vectors), dtype=bool)
+
+    @classmethod
+    def build(
+        cls,
+        embeddings_path,
+        dim,
+        rerank_candidates=64,
+        chunk_size=65536,
+        **hnsw_options,
+    ):
+        vectors = np.load(embeddings_path, mmap_mode="r")
+        projection = Projection.fit(vectors, dim)
+        projected = np.empty((len(vectors), dim), dtype=np.float32)
+        for start in range(0, len(vectors), chunk_size):
+            chunk = projection.project(vectors[start : start + chunk_size])
+            projected[start : start + len(chunk)] = chunk
+        graph = HNSWIndexManager(projected, **hnsw_options)
+        return cls(projection, graph, embeddings_path, rerank_candidates)
+
+    @staticmethod
+    def build_fingerprint(
+        embeddings_path,
+        projection_path,
+        dim,
+        ef_construction,
+        M,
+        embeddings_sha256=None,
+    ):
+        # space, ef_construction and M are read back by HNSWIndexManager._load.
+        return {
+            "embeddings_sha256": embeddings_sha256 or file_fingerprint(embeddings_path),
+            "projection_sha256": file_fingerprint(projection_path),
+            "dim": dim,
+            "space": "cosine",
+            "ef_construction": ef_construction,
+            "M": M,
+        }
+
+    @classmethod
+    def load_or_build(
+        cls,
+        embeddings_path,
+        index_path,
+        dim=256,
+        ef_construction=200,
+        M=16,
+        ef=50,
+        num_threads=-1,
+        rerank_candidates=64,
+        deleted_ids=(),
+        rebuild=False,
+        embeddings_sha256=None,
+    ):
+        """
+        Loads the projection and the projected graph saved next to the
+        bundle's HNSW index when the graph's fingerprint matches the
+        embeddings file, the projection and the parameters. Otherwise fits a
+        new projection, builds the graph and saves both.
+        """
+        embeddings_sha256 = embeddings_sha256 or file_fingerprint(embeddings_path)
+        projection_path = default_projection_path(index_path)
+        graph_path = default_projected_index_path(index_path)
+
+        metadata = HNSWIndexManager._read_metadata(graph_path)
+        if not rebuild and metadata and os.path.exists(projection_path):
+            fingerprint = cls.build_fingerprint(
+                embeddings_path,
+                projection_path,
+                dim,
+                ef_construction,
+                M,
+                embeddings_sha256,
+            )
+            if metadata["fingerprint"] == fingerprint:
+                graph = HNSWIndexManager._load(graph_path, metadata, ef, num_threads)
+                index = cls(
+                    Projection.load(projection_path),
+                    graph,
+                    embeddings_path,
+                    rerank_candidates,
+                )
+                # The saved graph already has its deleted ids marked.
+                index.deleted[np.asarray(deleted_ids, dtype=np.int64)] = True
+                return index
+
+        index = cls.build(
+            embeddings_path,
+            dim,
+            rerank_candidates,
+            ef_construction=ef_construction,
+            M=M,
+            ef=ef,
+            num_threads=num_threads,
+        )
+        index.mark_deleted(deleted_ids)
+        index.projection.save(
+            projection_path,
+            {"embeddings_sha256": embeddings_sha256, "dim": dim},
+        )
+        index.persist(embeddings_path, index_path, embeddings_sha256)
+        return index
+
+    def persist(self, embeddings_path, index_path, embeddings_sha256=None):
+        # index_path is the bundle's HNSW path; the projection and the
+        # projected graph live next to it, as in ServingBundle.load_index.
+        fingerprint = self.build_fingerprint(
+            embeddings_path,
+            default_projection_path(index_path),
+            self.projection.dim,
+            self.graph.ef_construction,
+            self.graph.M,
+            embeddings_sha256,
+        )
+        self.graph.save(default_projected_index_path(index_path), fingerprint)
+
+    def __len__(self):
+        return len(self.graph)
+
+    def memory_bytes(self):
+        # Graph links and projected vectors, as hnswlib lays them out.
+        count = self.graph.index.get_max_elements()
+        per_element = 4 * self.projection.dim + 4 * 2 * self.graph.M + 16
+        return count * per_element + self.projection.components.nbytes
+
+    def add_items(self, embeddings, ids):
+        # Rows are only ever appended after embeddings.npy has been extended.
+        # The file is reopened before the graph grows, so a concurrent query
+        # never finds an id without its full vector.
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(ids), dtype=bool)])
+        self.vectors = np.load(self.embeddings_path, mmap_mode="r")
+        self.graph.add_items(self.projection.project(embeddings), ids)
+
+    def mark_deleted(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        self.graph.mark_deleted(ids)
+        deleted = self.deleted.copy()
+        deleted[ids] = True
+        self.deleted = deleted
+
+    def _num_candidates(self, k):
+        live = len(self.deleted) - int(self.deleted.sum())
+        return max(min(max(self.rerank_candidates, k), live), 1)
+
+    def _rescore(self, query, candidates, k):
+        candidates = np.sort(candidates.astype(np.int64))  # file order
+        exact = normalize_rows(self.vectors[candidates]) @ query
+        best = np.argsort(-exact)[:k]
+        return candidates[best], 1 - exact[best]
+
+    def query(self, query_embedding, k, ef=None):
+        queries = normalize_rows(np.atleast_2d(query_embedding))
+        candidates, _ = self.graph.query(
+            self.projection.project(queries), self._num_candidates(k), ef
+        )
+
+        ids = np.zeros((len(queries), k), dtype=np.uint64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for row, query in enumerate(queries):
+            found_ids, found_distances = self._rescore(query, candidates[row], k)
+            ids[row, : len(found_ids)] = found_ids
+            distances[row, : len(found_ids)] = found_distances
+        return ids, distances
+
+    def query_filtered(self, query_embedding, k, allowed):
+        query = normalize_rows(np.atleast_2d(query_embedding))
+        projected = self.projection.project(query)
+        try:
+            candidates, _ = self.graph.query_filtered(
+                projected, self._num_candidates(k), allowed
+            )
+        except RuntimeError:
+            # Fewer allowed ids than candidates; this raises again when there
+            # are fewer than k, and FilteredSearch falls back to a scan.
+            candidates, _ = self.graph.query_filtered(projected, k, allowed)
+        ids, distances = self._rescore(query[0], candidates[0], k)
+        return ids[None].astype(np.uint64), distances[None]
+
+
+def default_projection_path(index_path):
+    return os.path.splitext(index_path)[0] + ".projection.npz"
+
+
+def default_projected_index_path(index_path):
+    return os.path.splitext(index_path)[0] + ".projected.hnsw"
+
+
+if __name__ == "__main__":
+    api_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(
+        description="Fit the projection and build the projected HNSW index for "
+        "an embeddings file."
+    )
+    parser.add_argument(
+        "--embeddings-path",
+        type=str,
+        default=os.path.join(api_dir, "embeddings", "embeddings.npy"),
+    )
+    parser.add_argument("--index-path", type=str, default=None)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--M", type=int, default=16)
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    index = ProjectedIndex.load_or_build(
+        args.embeddings_path,
+        args.index_path or os.path.splitext(args.embeddings_path)[0] + ".hnsw",
+        dim=args.dim,
+        ef_construction=args.ef_construction,
+        M=args.M,
+        rebuild=args.rebuild,
+    )
+    explained = float(index.projection.explained_variance.sum())
+    print(f"{len(index)} vectors at {args.dim} dims, {explained:.1%} of the variance")
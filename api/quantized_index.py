@@ -0,0 +1,121 @@
+import numpy as np
+
+from search_engine import SearchEngine
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class QuantizedIndex(SearchEngine):
+    """
+    Exact-scan cosine index over a compact copy of the corpus. Only the
+    float16 or int8 codes stay resident; int8 uses scalar quantization with a
+    per-dimension offset and scale. The best rerank_candidates by approximate
+    score are re-ranked with exact float32 scores read from the memory-mapped
+    embeddings file. Distances are 1 - cosine, like hnswlib's cosine space.
+    """
+
+    name = "quantized"
+
+    def __init__(
+        self, embeddings_path, precision="int8", rerank_candidates=64, chunk_size=4096
+    ):
+        if precision not in ("int8", "float16"):
+            raise ValueError("precision must be 'int8' or 'float16'.")
+        self.embeddings_path = embeddings_path
+        self.precision = precision
+        self.rerank_candidates = rerank_candidates
+        self.chunk_size = chunk_size
+
+        self.vectors = np.load(embeddings_path, mmap_mode="r")
+        self.dim = self.vectors.shape[1]
+        self.deleted = np.zeros(len(self.vectors), dtype=bool)
+        if precision == "int8":
+            self._fit_scales(self.vectors)
+        self.codes = self._encode(self.vectors)
+
+    def _chunks(self, vectors):
+        for start in range(0, len(vectors), self.chunk_size):
+            yield normalize_rows(vectors[start : start + self.chunk_size])
+
+    def _fit_scales(self, vectors):
+        low = np.full(self.dim, np.inf, dtype=np.float32)
+        high = np.full(self.dim, -np.inf, dtype=np.float32)
+        for chunk in self._chunks(vectors):
+            low = np.minimum(low, chunk.min(axis=0))
+            high = np.maximum(high, chunk.max(axis=0))
+        self.offset = low
+        self.scale = np.maximum(high - low, 1e-12) / 255
+
+    def _encode(self, vectors):
+        dtype = np.uint8 if self.precision == "int8" else np.float16
+        codes = np.empty((len(vectors), self.dim), dtype=dtype)
+        for start, chunk in zip(
+            range(0, len(vectors), self.chunk_size), self._chunks(vectors)
+        ):
+            if self.precision == "int8":
+                chunk = np.clip(np.rint((chunk - self.offset) / self.scale), 0, 255)
+            codes[start : start + len(chunk)] = chunk
+        return codes
+
+    def _approximate_scores(self, codes, query):
+        # For int8, q . (offset + scale * code) = q . offset + (q * scale) . code
+        if self.precision == "int8":
+            weights, bias = query * self.scale, float(query @ self.offset)
+        else:
+            weights, bias = query, 0.0
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), self.chunk_size):
+            chunk = codes[start : start + self.chunk_size].astype(np.float32)
+            scores[start : start + len(chunk)] = chunk @ weights + bias
+        return scores
+
+    def __len__(self):
+        return len(self.codes)
+
+    def memory_bytes(self):
+        extra = (
+            self.offset.nbytes + self.scale.nbytes if self.precision == "int8" else 0
+        )
+        return self.codes.nbytes + self.deleted.nbytes + extra
+
+    def add_items(self, embeddings, ids):
+        # Rows are only ever appended, in id order, after embeddings.npy has
+        # been extended. The codes are replaced last, so a concurrent query
+        # never sees codes without their vectors and deleted flags.
+        new_codes = self._encode(embeddings)
+        self.deleted = np.concatenate(
+            [self.deleted, np.zeros(len(new_codes), dtype=bool)]
+        )
+        self.vectors = np.load(self.embeddings_path, mmap_mode="r")
+        self.codes = np.concatenate([self.codes, new_codes])
+
+    def mark_deleted(self, ids):
+        deleted = self.deleted.copy()
+        deleted[np.asarray(ids, dtype=np.int64)] = True
+        self.deleted = deleted
+
+    def query(self, query_embedding, k, ef=None):
+        codes, vectors = self.codes, self.vectors
+        deleted = self.deleted[: len(codes)]
+        queries = normalize_rows(np.atleast_2d(query_embedding))
+
+        ids = np.empty((len(queries), k), dtype=np.uint64)
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        for row, query in enumerate(queries):
+            scores = self._approximate_scores(codes, query)
+            scores[deleted] = -np.inf
+
+            num_candidates = min(max(self.rerank_candidates, k), len(scores))
+            candidates = np.argpartition(-scores, num_candidates - 1)[:num_candidates]
+            candidates.sort()  # read the mmap'd rows in file order
+
+            exact = normalize_rows(vectors[candidates]) @ query
+            exact[deleted[candidates]] = -np.inf
+            best = np.argsort(-exact)[:k]
+            ids[row] = candidates[best]
+            distances[row] = 1 - exact[best]
+        return ids, distances
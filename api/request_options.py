@@ -0,0 +1,48 @@
+from config import ACCURACY_TIERS, SNIPPET_MAX_CHARS
+from serialization import ResponseView
+
+# Largest maxResults a search endpoint accepts.
+MAX_RESULTS_LIMIT = 4
+
+
+def page_options(args, default_max_results=3):
+    """
+    Returns the maxResults and the ResponseView of a search request, parsed
+    from its query string: Flask's request.args or Starlette's query_params.
+    Raises ValueError with the message to answer with 400.
+    """
+    try:
+        max_results = int(args.get("maxResults"))
+    except (TypeError, ValueError):
+        max_results = default_max_results
+    if max_results < 1:
+        raise ValueError("Max results should be at least 1!")
+    if max_results > MAX_RESULTS_LIMIT:
+        raise ValueError(f"Max results should not exceed {MAX_RESULTS_LIMIT}!")
+    return max_results, ResponseView.from_args(args, SNIPPET_MAX_CHARS)
+
+
+def query_options(args, content, bundle):
+    """
+    Returns the HNSW ef of the requested accuracy tier and the labels a search
+    is filtered by, checked against the bundle's labels. Raises ValueError
+    with the message to answer with 400.
+    """
+    accuracy = args.get("accuracy")
+    if accuracy is not None and accuracy not in ACCURACY_TIERS:
+        tiers = ", ".join(ACCURACY_TIERS)
+        raise ValueError(f"Accuracy should be one of: {tiers}!")
+
+    labels = content.get("labels") or None
+    if labels is not None and not (
+        isinstance(labels, list) and all(isinstance(label, str) for label in labels)
+    ):
+        raise ValueError("Labels should be a list of strings!")
+    check_labels(labels, bundle)
+    return ACCURACY_TIERS.get(accuracy), labels
+
+
+def check_labels(labels, bundle):
+    unknown = bundle.unknown_labels(labels or [])
+    if unknown:
+        raise ValueError(f"Unknown labels: {', '.join(unknown)}!")
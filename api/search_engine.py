@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+
+
+class SearchEngine:
+    """
+    Interface shared by the search engines. query takes one embedding or an
+    (n, dim) matrix and returns hnswlib-style (ids, distances) arrays of shape
+    (n, k), where distance is 1 - cosine similarity and ids are article ids.
+    ef overrides the HNSW search breadth for one query; engines without such
+    a knob ignore it.
+    """
+
+    name = None
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def query(self, query_embedding, k, ef=None):
+        raise NotImplementedError
+
+    def query_filtered(self, query_embedding, k, allowed):
+        """
+        Searches a single query among the ids whose flag in the boolean array
+        allowed is set. Results may hold fewer than k ids. This default
+        over-fetches from query and drops the other ids, widening the search
+        until k of them are found or the whole index has been searched.
+        """
+        fetch = k / max(allowed.mean(), 1 / len(allowed)) * 2
+        while True:
+            fetch = min(int(fetch), len(self))
+            ids, distances = self.query(query_embedding, fetch)
+            ids, distances = ids[0], distances[0]
+            keep = allowed[ids] & np.isfinite(distances)
+            if keep.sum() >= k or fetch == len(self):
+                return ids[None, keep][:, :k], distances[None, keep][:, :k]
+            fetch *= 2
+
+    def add_items(self, embeddings, ids):
+        raise NotImplementedError
+
+    def mark_deleted(self, ids):
+        raise NotImplementedError
+
+    def persist(self, embeddings_path, index_path, embeddings_sha256=None):
+        # Engines rebuilt from embeddings.npy and the article store on load
+        # have nothing to save. Engines that save an artifact record the
+        # embeddings file's SHA-256, which callers that already computed it
+        # pass as embeddings_sha256.
+        pass
+
+
+def sample_queries(vectors, size=16, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), size=min(size, len(vectors)), replace=False)
+    return np.asarray(vectors[np.sort(rows)], dtype=np.float32)
+
+
+def fastest_engine(engines, sample_queries, k, repeats=3):
+    """
+    Runs the sample queries one at a time through every engine and returns the
+    engine with the lowest median latency, together with all the timings.
+    """
+    timings = {}
+    for engine in engines:
+        engine.query(sample_queries[0], k)  # warm-up
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for query in sample_queries:
+                engine.query(query, k)
+            runs.append((time.perf_counter() - start) / len(sample_queries))
+        timings[engine.name] = float(np.median(runs))
+    best = min(engines, key=lambda engine: timings[engine.name])
+    return best, timings
@@ -0,0 +1,109 @@
+import gzip
+
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+from metrics import stage
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; clients then get gzip
+    brotli = None
+
+FIELDS = ("id", "title", "label", "text", "url", "distance")
+
+
+def dumps(content):
+    # Compact, sorted and newline-terminated, like Flask's jsonify.
+    with stage("serialize"):
+        return orjson.dumps(content, option=orjson.OPT_SORT_KEYS) + b"\n"
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, with jsonify's output format."""
+
+    def dumps(self, obj, **kwargs):
+        with stage("serialize"):
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def snippet(text, max_chars):
+    # Cuts at the last word boundary within max_chars.
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars + 1)
+    return text[: cut if cut > 0 else max_chars].rstrip() + "…"
+
+
+class ResponseView:
+    """
+    The fields of each hit a client asked for, through the comma-separated
+    "fields" parameter, and an optional "snippet" length that replaces the
+    full text with an excerpt of at most that many characters.
+    """
+
+    def __init__(self, fields=FIELDS, snippet_chars=None):
+        self.fields = fields
+        self.snippet_chars = snippet_chars
+
+    @classmethod
+    def from_args(cls, args, max_snippet_chars):
+        fields = FIELDS
+        if args.get("fields"):
+            fields = tuple(field.strip() for field in args["fields"].split(","))
+            unknown = [field for field in fields if field not in FIELDS]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}!")
+
+        snippet_chars = None
+        if args.get("snippet"):
+            try:
+                snippet_chars = int(args["snippet"])
+            except ValueError:
+                snippet_chars = 0
+            if snippet_chars <= 0:
+                raise ValueError("Snippet should be a positive number of characters!")
+            snippet_chars = min(snippet_chars, max_snippet_chars)
+        return cls(fields, snippet_chars)
+
+    def apply(self, best_fits):
+        if self.fields == FIELDS and self.snippet_chars is None:
+            return best_fits
+        projected = []
+        for best_fit in best_fits:
+            hit = {field: best_fit[field] for field in self.fields}
+            if self.snippet_chars is not None and "text" in hit:
+                hit["text"] = snippet(hit["text"], self.snippet_chars)
+            projected.append(hit)
+        return projected
+
+
+def choose_encoding(accept_encoding):
+    accepted = {
+        value.split(";")[0].strip().lower()
+        for value in (accept_encoding or "").split(",")
+        if not value.strip().endswith(";q=0")
+    }
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body, accept_encoding, min_bytes, gzip_level=6, brotli_quality=4):
+    """
+    Compresses body with the best encoding the client accepts, brotli before
+    gzip, and returns (body, encoding). Bodies below min_bytes are returned
+    as they are, with an encoding of None.
+    """
+    encoding = choose_encoding(accept_encoding) if len(body) >= min_bytes else None
+    if encoding is None:
+        return body, None
+    with stage("compress"):
+        if encoding == "br":
+            return brotli.compress(body, quality=brotli_quality), encoding
+        return gzip.compress(body, compresslevel=gzip_level, mtime=0), encoding
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, api_dir)
+sys.path.insert(0, os.path.join(api_dir, "benchmarks"))
+
+from bench_text_normalizer import SAMPLE_QUERIES, reference_process_text  # noqa: E402
+from utils import TextNormalizer, process_text  # noqa: E402
+
+EDGE_CASES = [
+    "",
+    "   ",
+    "?!.,;:",
+    "THE AND OF",
+    "Don't stop-believing: it's e-mail, U.S.A. & co.",
+    "Numbers 3.14, 1,000 and 42nd street",
+    "Café naïve résumé",
+    "running runs ran runner",
+    "Tabs\tand\nnew lines",
+]
+
+
+@pytest.fixture(scope="module")
+def normalizer():
+    # Downloads the NLTK resources when they are missing and SYNAPTIC_NLTK_OFFLINE
+    # is off; without them neither implementation can run.
+    try:
+        normalizer = TextNormalizer()
+        reference_process_text("")
+    except LookupError as e:
+        pytest.skip(f"NLTK resources unavailable: {e}")
+    return normalizer
+
+
+@pytest.mark.parametrize("text", SAMPLE_QUERIES + EDGE_CASES)
+def test_matches_reference(normalizer, text):
+    assert normalizer.normalize(text) == reference_process_text(text)
+
+
+def test_batch_matches_reference(normalizer):
+    # Repeated texts go through the per-token cache on their second pass.
+    texts = (SAMPLE_QUERIES + EDGE_CASES) * 2
+    expected = [reference_process_text(text) for text in texts]
+    assert normalizer.normalize_batch(texts) == expected
+
+
+def test_process_text_matches_reference(normalizer):
+    for text in SAMPLE_QUERIES:
+        assert process_text(text) == reference_process_text(text)
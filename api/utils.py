@@ -1,43 +1,128 @@
 import string
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer, WordNetLemmatizer
+from functools import lru_cache
 
+import os
 import random
 import numpy as np
-import torch
+import psutil
 
-nltk.download("punkt")
-nltk.download("wordnet")
-nltk.download("stopwords")
+from config import NLTK_OFFLINE
+
+# NLTK resources used by TextNormalizer, by download name and data path.
+NLTK_RESOURCES = {
+    "punkt": "tokenizers/punkt",
+    "wordnet": "corpora/wordnet",
+    "stopwords": "corpora/stopwords",
+}
+
+
+def ensure_nltk_resources(offline=NLTK_OFFLINE):
+    """
+    Looks the NLTK resources up in the local NLTK data directories (see
+    NLTK_DATA) and downloads only the missing ones, so a provisioned machine
+    never touches the network. Offline, missing resources raise LookupError.
+    """
+    import nltk
+
+    missing = []
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(name)
+    if missing and offline:
+        raise LookupError(
+            f"Missing NLTK resources: {', '.join(missing)}. "
+            f"Install them with: python -m nltk.downloader {' '.join(missing)}"
+        )
+    for name in missing:
+        nltk.download(name, quiet=True)
 
 
 def set_seed(seed=42):
+    # torch is seeded by seed_torch when a torch encoder is loaded, so the
+    # onnx and stub backends never import it.
     random.seed(seed)
     np.random.seed(seed)
+
+
+def seed_torch(seed=42):
+    import torch
+
     torch.manual_seed(seed)
     torch.cuda.manual_seed_all(seed)
 
 
-def process_text(text):
+def process_started_at():
+    return psutil.Process(os.getpid()).create_time()
 
-    text = text.lower()
 
-    table = str.maketrans("", "", string.punctuation)
-    text = text.translate(table)
+def memory_usage(pid=None):
+    """
+    Returns the memory of a process in bytes. rss counts shared pages in full,
+    uss only the pages private to the process and pss splits the shared pages
+    between the processes that map them.
+    """
+    process = psutil.Process(pid or os.getpid())
+    info = process.memory_full_info()
+    return {
+        "pid": process.pid,
+        "rss": info.rss,
+        "uss": getattr(info, "uss", None),
+        "pss": getattr(info, "pss", None),
+    }
 
-    words = nltk.word_tokenize(text)
 
-    stop_words = set(stopwords.words("english"))
-    words = [word for word in words if word not in stop_words]
+class TextNormalizer:
+    """
+    Lowercases, strips punctuation, tokenizes, removes stopwords and
+    stems + lemmatizes text. The NLTK resources are loaded once and the
+    stem + lemma result is memoized per token, since queries share a small
+    vocabulary. NLTK itself is imported on first use, since importing it takes
+    seconds.
+    """
 
-    stemmer = PorterStemmer()
-    lemmatizer = WordNetLemmatizer()
+    def __init__(self, token_cache_size=65536):
+        ensure_nltk_resources()
+        from nltk import word_tokenize
+        from nltk.corpus import stopwords
+        from nltk.stem import PorterStemmer, WordNetLemmatizer
 
-    words_stemmed_lemmatized = [
-        lemmatizer.lemmatize(stemmer.stem(word)) for word in words
-    ]
+        self.word_tokenize = word_tokenize
+        self.punctuation_table = str.maketrans("", "", string.punctuation)
+        self.stop_words = frozenset(stopwords.words("english"))
+        self.stemmer = PorterStemmer()
+        self.lemmatizer = WordNetLemmatizer()
+        self.normalize_token = lru_cache(maxsize=token_cache_size)(
+            self._normalize_token
+        )
 
-    processed_text = " ".join(words_stemmed_lemmatized)
+    def _normalize_token(self, word):
+        return self.lemmatizer.lemmatize(self.stemmer.stem(word))
 
-    return processed_text
+    def normalize(self, text):
+        text = text.lower().translate(self.punctuation_table)
+        normalize_token = self.normalize_token
+        stop_words = self.stop_words
+        return " ".join(
+            normalize_token(word)
+            for word in self.word_tokenize(text)
+            if word not in stop_words
+        )
+
+    def normalize_batch(self, texts):
+        return [self.normalize(text) for text in texts]
+
+
+_default_normalizer = None
+
+
+def get_text_normalizer():
+    global _default_normalizer
+    if _default_normalizer is None:
+        _default_normalizer = TextNormalizer()
+    return _default_normalizer
+
+
+def process_text(text):
+    return get_text_normalizer().normalize(text)